@@ -3,6 +3,9 @@ ASGI config for core project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Live stock updates (materials.views.stock_events) are long-lived server-sent
+event streams and need an ASGI server, e.g.: uvicorn core.asgi:application
+
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 """
@@ -0,0 +1,51 @@
+"""
+Бэкенды аутентификации, которые берут пользователя запроса из кэша.
+
+AuthenticationMiddleware на каждом запросе получает request.user через get_user()
+бэкенда; кэширующие бэкенды хранят объект User в кэше default AUTH_USER_CACHE_TIMEOUT
+секунд. Запись удаляется при сохранении и удалении пользователя (materials/signals.py),
+поэтому смена пароля по-прежнему завершает сессии через хэш аутентификации сессии.
+
+Сброс записи доходит до других процессов только через общий кэш; с локальным
+кэшем процесса (LocMemCache) бэкенды кэш не используют, иначе остальные воркеры
+продолжали бы пускать отключенного пользователя или пользователя с отозванными правами.
+"""
+
+from allauth.account.auth_backends import AuthenticationBackend
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+from .cache import shared_cache_configured
+
+
+def _user_cache_key(user_id):
+    return f'auth_user:{user_id}'
+
+
+def invalidate_cached_user(user_id):
+    """Удаляет пользователя из кэша (вызывается при изменении и удалении)"""
+    cache.delete(_user_cache_key(user_id))
+
+
+class CachedUserMixin:
+    """Кэширует результат get_user() бэкенда по id пользователя (только в общем кэше)"""
+
+    def get_user(self, user_id):
+        if not shared_cache_configured():
+            return super().get_user(user_id)
+        key = _user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, user, getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 300))
+        return user
+
+
+class CachedModelBackend(CachedUserMixin, ModelBackend):
+    pass
+
+
+class CachedAccountBackend(CachedUserMixin, AuthenticationBackend):
+    pass
@@ -0,0 +1,33 @@
+"""
+Проверки для функций, которым нужен кэш, общий для всех процессов.
+
+Привязки к основной базе после записи, версии индекса материалов, закэшированные
+пользователи запросов и сводка для сотрудников записываются одним процессом
+(воркером или management-командой), а читаются другими. С локальным кэшем процесса
+они молча перестают работать: каждый воркер видит только свои записи.
+"""
+
+from django.conf import settings
+
+# Бэкенды, у которых incr() атомарен между процессами (у файлового и БД-кэша это get + set)
+ATOMIC_INCR_BACKENDS = (
+    'django.core.cache.backends.redis.RedisCache',
+    'django.core.cache.backends.memcached.PyMemcacheCache',
+    'django.core.cache.backends.memcached.PyLibMCCache',
+)
+
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def shared_cache_configured(alias='default'):
+    """Виден ли кэш alias всем процессам (не LocMemCache и не DummyCache)"""
+    backend = settings.CACHES.get(alias, {}).get('BACKEND', PROCESS_LOCAL_BACKENDS[0])
+    return backend not in PROCESS_LOCAL_BACKENDS
+
+
+def atomic_incr_configured(alias='default'):
+    """Атомарен ли cache.incr() кэша alias для конкурирующих процессов"""
+    return settings.CACHES.get(alias, {}).get('BACKEND') in ATOMIC_INCR_BACKENDS
@@ -0,0 +1,114 @@
+"""
+Профилирование запросов и management-команд по требованию.
+
+По умолчанию выключено. Запрос профилируется, если включен PROFILING_ENABLED и
+запрос попал в выборку PROFILING_SAMPLE_RATE, или если сотрудник добавил параметр
+PROFILING_QUERY_FLAG (например, ?_profile=1). Профиль сохраняется в PROFILING_DIR
+файлом .prof с именем представления и временем; хранятся не больше
+PROFILING_MAX_FILES последних дампов.
+
+В процессе одновременно снимается только один профиль: cProfile нельзя включить
+дважды, а на Python 3.12+ он видит все потоки, поэтому параллельные запросы
+обслуживаются без профилирования, а не завершаются ошибкой.
+"""
+
+import cProfile
+import random
+import re
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.urls import Resolver404, resolve
+
+
+# cProfile профилирует весь процесс, поэтому одновременно снимается не больше одного профиля
+_profiler_lock = threading.Lock()
+
+
+def profiling_dir():
+    return Path(getattr(settings, 'PROFILING_DIR', settings.BASE_DIR / 'profiles'))
+
+
+def _safe_name(name):
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', name).strip('_') or 'unknown'
+
+
+def _rotate(directory):
+    max_files = getattr(settings, 'PROFILING_MAX_FILES', 200)
+    dumps = sorted(directory.glob('*.prof'), key=lambda path: path.stat().st_mtime, reverse=True)
+    for path in dumps[max_files:]:
+        path.unlink(missing_ok=True)
+
+
+def dump_profile(profiler, name):
+    """Сохраняет профиль в каталог профилей и удаляет самые старые дампы сверх лимита"""
+    directory = profiling_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    timestamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+    path = directory / f'{_safe_name(name)}-{timestamp}.prof'
+    profiler.dump_stats(path)
+    _rotate(directory)
+    return path
+
+
+@contextmanager
+def profile_to_disk(name):
+    """
+    Профилирует блок кода и записывает результат в .prof файл. В процессе активен
+    только один профиль: если он уже снимается (или профилировщик занят другим
+    инструментом), блок выполняется без профилирования и получает None.
+    """
+    if not _profiler_lock.acquire(blocking=False):
+        yield None
+        return
+    try:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+: cProfile на sys.monitoring допускает один активный профилировщик
+            profiler = None
+        if profiler is None:
+            yield None
+            return
+        try:
+            yield profiler
+        finally:
+            profiler.disable()
+            dump_profile(profiler, name)
+    finally:
+        _profiler_lock.release()
+
+
+class ProfilingMiddleware:
+    """Снимает cProfile для выбранных запросов (по настройке, выборке или флагу в запросе)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not self._should_profile(request):
+            return self.get_response(request)
+        with profile_to_disk(self._view_name(request)):
+            return self.get_response(request)
+
+    def _should_profile(self, request):
+        flag = getattr(settings, 'PROFILING_QUERY_FLAG', '_profile')
+        if flag and flag in request.GET:
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_staff:
+                return True
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            return False
+        return random.random() < getattr(settings, 'PROFILING_SAMPLE_RATE', 1.0)
+
+    @staticmethod
+    def _view_name(request):
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return 'not_found'
+        return match.url_name or match.view_name
@@ -0,0 +1,60 @@
+"""
+Бюджет запросов к базе, выполняемых до вызова представления.
+
+Загрузка сессии, получение пользователя и остальные middleware — постоянная цена
+каждой страницы. QueryBudgetMiddleware считает запросы до process_view() по всем
+настроенным базам и сообщает о запросах сверх QUERY_BUDGET_BEFORE_VIEW. С
+QUERY_BUDGET_STRICT (удобно в тестах) запрос завершается AssertionError вместо
+предупреждения в журнале.
+"""
+
+import logging
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        self.statements.append(sql)
+        return execute(sql, params, many, context)
+
+
+class QueryBudgetMiddleware:
+    """Ставится первым в MIDDLEWARE, чтобы учитывать запросы всех остальных middleware"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        budget = getattr(settings, 'QUERY_BUDGET_BEFORE_VIEW', None)
+        if budget is None:
+            return self.get_response(request)
+
+        counter = QueryCounter()
+        request._query_counter = counter
+        with ExitStack() as stack:
+            for alias in settings.DATABASES:
+                stack.enter_context(connections[alias].execute_wrapper(counter))
+            return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        counter = getattr(request, '_query_counter', None)
+        budget = getattr(settings, 'QUERY_BUDGET_BEFORE_VIEW', None)
+        if counter is None or budget is None or counter.count <= budget:
+            return None
+
+        message = (f"{request.path}: {counter.count} запросов к базе до вызова представления "
+                   f"(бюджет {budget}):\n" + "\n".join(counter.statements))
+        if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+            raise AssertionError(message)
+        logger.warning(message)
+        return None
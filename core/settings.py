@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -49,12 +50,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.query_budget.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'allauth.account.middleware.AccountMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'materials.sharding.ShardMiddleware',
+    'materials.replicas.ReplicaMiddleware',
+    'core.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -92,6 +97,56 @@ DATABASES = {
     }
 }
 
+# Шардирование складов по владельцам: WAREHOUSE_SHARDS=N добавляет N-1 отдельных баз.
+# Каждый пользователь закрепляется за одной из них (см. materials/sharding.py).
+WAREHOUSE_SHARD_COUNT = max(1, int(os.environ.get('WAREHOUSE_SHARDS', 1)))
+for shard_index in range(1, WAREHOUSE_SHARD_COUNT):
+    DATABASES[f'shard_{shard_index}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / f'db_shard_{shard_index}.sqlite3',
+    }
+WAREHOUSE_SHARDS = ['default'] + [f'shard_{index}' for index in range(1, WAREHOUSE_SHARD_COUNT)]
+
+# Реплики для чтения: WAREHOUSE_READ_REPLICAS=1 добавляет к каждой базе копию <alias>_replica.
+# Тяжелые отчеты и прогнозы читают с реплики внутри read_replica() (materials/replicas.py);
+# локально реплика — копия файла SQLite, обновляемая командой refresh_replica.
+READ_REPLICAS = {}
+if os.environ.get('WAREHOUSE_READ_REPLICAS') == '1':
+    for alias in WAREHOUSE_SHARDS:
+        primary_name = DATABASES[alias]['NAME']
+        READ_REPLICAS[alias] = f'{alias}_replica'
+        DATABASES[f'{alias}_replica'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': primary_name.with_name(f'{primary_name.stem}_replica.sqlite3'),
+            'TEST': {'MIRROR': alias},
+        }
+# Сколько секунд после записи пользователь читает только с основной базы (read-your-writes);
+# должно быть не меньше интервала обновления реплики
+READ_REPLICA_PIN_SECONDS = int(os.environ.get('WAREHOUSE_REPLICA_PIN_SECONDS', 60))
+
+DATABASE_ROUTERS = ['materials.replicas.ReplicaRouter', 'materials.sharding.ShardRouter']
+
+# Кэш, общий для всех процессов сервера и команд: метки read-your-writes реплик, версии
+# индекса материалов, пользователи запросов, сводка для сотрудников. С DJANGO_REDIS_URL — Redis,
+# иначе файловый кэш (общий для процессов одной машины). LocMemCache у каждого процесса свой
+# и для этих задач не подходит (см. materials/checks.py). Только с Redis (атомарный incr)
+# индекс материалов применяет изменения дельтами, с файловым кэшем — перестраивается.
+if os.environ.get('DJANGO_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['DJANGO_REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('DJANGO_CACHE_DIR', str(BASE_DIR / 'cache')),
+            'OPTIONS': {'MAX_ENTRIES': 50000},
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -130,15 +185,70 @@ USE_TZ = True
 STATIC_URL = 'static/'
 
 AUTHENTICATION_BACKENDS = [
-    # Django's built-in (для админки)
-    'django.contrib.auth.backends.ModelBackend',
+    # Django's built-in (для админки); пользователь запроса берется из кэша (core/auth.py)
+    'core.auth.CachedModelBackend',
     # allauth specific (для регистрации/входа)
-    'allauth.account.auth_backends.AuthenticationBackend',
+    'core.auth.CachedAccountBackend',
 ]
+# Сколько секунд пользователь запроса хранится в кэше (сбрасывается при изменении пользователя)
+AUTH_USER_CACHE_TIMEOUT = 300
+
+# Сессии: по умолчанию cached_db (чтение из кэша, база — только при промахе).
+# Без обращений к базе: DJANGO_SESSION_ENGINE=django.contrib.sessions.backends.signed_cookies
+SESSION_ENGINE = os.environ.get('DJANGO_SESSION_ENGINE', 'django.contrib.sessions.backends.cached_db')
+
+# Бюджет запросов к базе до вызова представления (сессия, пользователь, middleware).
+# None — проверка выключена; QUERY_BUDGET_STRICT=True (для тестов) превращает превышение в ошибку.
+QUERY_BUDGET_BEFORE_VIEW = 1 if DEBUG else None
+QUERY_BUDGET_STRICT = False
 SITE_ID = 1
 # Куда перенаправлять пользователя после успешного входа (на главную страницу)
 LOGIN_REDIRECT_URL = '/materials/list/'
 # Куда перенаправлять пользователя после выхода (на главную страницу)
 LOGOUT_REDIRECT_URL = '/accounts/login/'
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
-CRISPY_TEMPLATE_PACK = "bootstrap5"
\ No newline at end of file
+CRISPY_TEMPLATE_PACK = "bootstrap5"
+# Кэш советов GigaChat: время жизни записи (сек) и максимальное число записей
+GIGACHAT_ADVICE_TTL = 24 * 60 * 60
+GIGACHAT_ADVICE_CACHE_SIZE = 5000
+
+# Индекс материалов в памяти процесса для фильтров списка (materials/index.py):
+# сколько пользователей держать (LRU) и доля запросов со сверкой индекса с базой
+MATERIAL_INDEX_MAX_USERS = 256
+MATERIAL_INDEX_VERIFY_RATE = 0.01
+
+# Страховой запас (min_threshold) по статистике расхода: срок поставки в днях и целевой уровень сервиса
+SAFETY_STOCK_LEAD_TIME_DAYS = 7
+SAFETY_STOCK_SERVICE_LEVEL = 0.95
+
+# Ограничение тяжелых прогнозов (forecasting/admission.py) в каждом процессе: одновременных расчетов,
+# запросов одного пользователя, мест в очереди ожидания и секунд ожидания (дальше — 429/503)
+FORECAST_MAX_CONCURRENT = 4
+FORECAST_MAX_PER_USER = 1
+FORECAST_MAX_QUEUE = 8
+FORECAST_QUEUE_TIMEOUT = 10
+FORECAST_RETRY_AFTER = 5
+# Максимальный горизонт прогноза в днях (параметр ?days=)
+FORECAST_MAX_DAYS = 365
+
+# Сводка по всем складам для сотрудников (materials/dashboard.py): число последних недель
+# в объеме операций и время жизни кэша (сек). Обновление — команда refresh_staff_dashboard
+# по расписанию (чаще времени жизни), она пишет сводку в общий кэш CACHES
+STAFF_DASHBOARD_WEEKS = 4
+STAFF_DASHBOARD_CACHE_TIMEOUT = 15 * 60
+
+# Брокер событий об изменении остатков (server-sent events на странице списка).
+# Для нескольких процессов: {'BACKEND': 'materials.events.RedisBroker', 'OPTIONS': {'url': 'redis://localhost:6379/0'}}
+STOCK_EVENTS_BROKER = {
+    'BACKEND': 'materials.events.InProcessBroker',
+}
+# Поток событий работает только под ASGI (uvicorn core.asgi:application); под WSGI страница его не открывает
+STOCK_EVENTS_ENABLED = True
+
+# Профилирование (выключено по умолчанию). Сотрудник может профилировать отдельный
+# запрос параметром ?_profile=1; дампы .prof пишутся в PROFILING_DIR с ротацией.
+PROFILING_ENABLED = os.environ.get('DJANGO_PROFILING') == '1'
+PROFILING_SAMPLE_RATE = float(os.environ.get('DJANGO_PROFILING_SAMPLE_RATE', 0.01))
+PROFILING_QUERY_FLAG = '_profile'
+PROFILING_DIR = BASE_DIR / 'profiles'
+PROFILING_MAX_FILES = 200
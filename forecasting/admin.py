@@ -1,3 +1,19 @@
 from django.contrib import admin
+from .models import AdviceCache, StockAnomaly
 
-# Register your models here.
+
+@admin.register(AdviceCache)
+class AdviceCacheAdmin(admin.ModelAdmin):
+    list_display = ('key', 'hits', 'created_at', 'last_used_at')
+    readonly_fields = ('key', 'prompt', 'response', 'created_at', 'last_used_at', 'hits')
+    search_fields = ('key', 'prompt')
+
+
+@admin.register(StockAnomaly)
+class StockAnomalyAdmin(admin.ModelAdmin):
+    list_display = ('detected_on', 'material', 'kind', 'score', 'details')
+    list_select_related = ('material',)
+    list_filter = ('kind',)
+    date_hierarchy = 'detected_on'
+    autocomplete_fields = ('material',)
+    show_full_result_count = False
@@ -0,0 +1,152 @@
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.http import HttpResponse
+
+
+class ForecastRejected(Exception):
+    """Запрос прогноза не допущен: status — HTTP-код ответа (429 или 503)"""
+
+    def __init__(self, status, reason, message):
+        super().__init__(message)
+        self.status = status
+        self.reason = reason
+
+
+class ForecastLimiter:
+    """
+    Ограничитель параллельных прогнозов в процессе: не больше max_concurrent расчетов,
+    не больше per_user запросов одного пользователя (включая ожидающих) и очередь
+    ожидания не длиннее max_queue. Лишние запросы отклоняются сразу, а не копятся на воркерах.
+    """
+
+    def __init__(self, max_concurrent, per_user, max_queue, queue_timeout):
+        self.max_concurrent = max_concurrent
+        self.per_user = per_user
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._condition = threading.Condition()
+        self._running = 0
+        self._waiting = 0
+        self._per_user = {}
+        self._stats = {
+            'admitted': 0,
+            'rejected_user_limit': 0,
+            'rejected_queue_full': 0,
+            'rejected_timeout': 0,
+            'max_waiting': 0,
+            'wait_seconds_total': 0.0,
+        }
+
+    def acquire(self, user_id):
+        with self._condition:
+            if self._per_user.get(user_id, 0) >= self.per_user:
+                self._stats['rejected_user_limit'] += 1
+                raise ForecastRejected(429, 'user_limit', "Дождитесь завершения предыдущего прогноза")
+
+            if self._running >= self.max_concurrent or self._waiting:
+                if self._waiting >= self.max_queue:
+                    self._stats['rejected_queue_full'] += 1
+                    raise ForecastRejected(503, 'queue_full', "Сервис прогнозов перегружен, повторите позже")
+                self._wait_for_slot(user_id)
+
+            self._running += 1
+            self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+            self._stats['admitted'] += 1
+
+    def _wait_for_slot(self, user_id):
+        # Вызывается под self._condition; ожидающий тоже занимает лимит пользователя
+        self._waiting += 1
+        self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+        self._stats['max_waiting'] = max(self._stats['max_waiting'], self._waiting)
+        started = time.monotonic()
+        try:
+            admitted = self._condition.wait_for(lambda: self._running < self.max_concurrent,
+                                                timeout=self.queue_timeout)
+        finally:
+            self._waiting -= 1
+            self._release_user(user_id)
+            self._stats['wait_seconds_total'] += time.monotonic() - started
+        if not admitted:
+            self._stats['rejected_timeout'] += 1
+            raise ForecastRejected(503, 'timeout', "Сервис прогнозов перегружен, повторите позже")
+
+    def _release_user(self, user_id):
+        left = self._per_user.get(user_id, 0) - 1
+        if left > 0:
+            self._per_user[user_id] = left
+        else:
+            self._per_user.pop(user_id, None)
+
+    def release(self, user_id):
+        with self._condition:
+            self._running -= 1
+            self._release_user(user_id)
+            self._condition.notify()
+
+    @contextmanager
+    def slot(self, user_id):
+        self.acquire(user_id)
+        try:
+            yield
+        finally:
+            self.release(user_id)
+
+    def metrics(self):
+        with self._condition:
+            return {
+                'running': self._running,
+                'waiting': self._waiting,
+                'max_concurrent': self.max_concurrent,
+                'per_user': self.per_user,
+                'max_queue': self.max_queue,
+                **self._stats,
+            }
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_forecast_limiter():
+    """Ограничитель процесса с параметрами из настроек FORECAST_*"""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = ForecastLimiter(
+                    max_concurrent=getattr(settings, 'FORECAST_MAX_CONCURRENT', 4),
+                    per_user=getattr(settings, 'FORECAST_MAX_PER_USER', 1),
+                    max_queue=getattr(settings, 'FORECAST_MAX_QUEUE', 8),
+                    queue_timeout=getattr(settings, 'FORECAST_QUEUE_TIMEOUT', 10),
+                )
+    return _limiter
+
+
+def forecast_horizon(raw, default=30):
+    """Горизонт прогноза из параметра запроса: некорректное значение — default, не больше FORECAST_MAX_DAYS"""
+    try:
+        days = int(raw)
+    except (TypeError, ValueError):
+        days = default
+    return min(max(days, 1), getattr(settings, 'FORECAST_MAX_DAYS', 365))
+
+
+def forecast_admission(view):
+    """Декоратор представлений с тяжелым прогнозом: допуск через ограничитель, иначе 429/503"""
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            with get_forecast_limiter().slot(request.user.pk):
+                return view(request, *args, **kwargs)
+        except ForecastRejected as rejected:
+            response = HttpResponse(str(rejected), status=rejected.status,
+                                    content_type='text/plain; charset=utf-8')
+            response['Retry-After'] = str(getattr(settings, 'FORECAST_RETRY_AFTER', 5))
+            return response
+
+    return wrapper
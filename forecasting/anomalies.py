@@ -0,0 +1,144 @@
+from datetime import date, timedelta
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from materials.ledger import ledger_balances
+from materials.models import Material
+from materials.sharding import shard_atomic
+from .model_utils import build_usage_matrix
+from .models import StockAnomaly, LedgerCheckpoint
+
+# Коэффициент, приводящий MAD к стандартному отклонению нормального распределения
+MAD_SCALE = 1.4826
+BASELINE_DAYS = 28
+RECENT_DAYS = 7
+BADGE_DAYS = 7
+# Редкий расход (активных дней меньше половины базового окна): z-score не применяется,
+# всплеском считается день, превышающий максимум окна в SPARSE_SPIKE_RATIO раз
+SPARSE_SPIKE_RATIO = 3.0
+
+
+def _rolling_baseline(matrix, recent_days, baseline_days):
+    """
+    Для каждого из последних recent_days дней — медиана, MAD, среднее, ст. отклонение,
+    максимум и число активных дней по предыдущим baseline_days дням (матрицы материалы × recent_days).
+    """
+    windows = sliding_window_view(matrix[:, :-1], baseline_days, axis=1)[:, -recent_days:, :]
+    median = np.median(windows, axis=2)
+    mad = np.median(np.abs(windows - median[:, :, None]), axis=2)
+    mean = windows.mean(axis=2)
+    std = windows.std(axis=2)
+    peak = windows.max(axis=2)
+    active_days = (windows > 0).sum(axis=2)
+    return median, mad, mean, std, peak, active_days
+
+
+def detect_usage_anomalies(matrix, z_threshold=4.0, drop_ratio=0.1,
+                           recent_days=RECENT_DAYS, baseline_days=BASELINE_DAYS):
+    """
+    Векторный поиск всплесков и провалов расхода.
+    Возвращает (spikes, drops): массивы (индекс строки, оценка, значение, база).
+    """
+    recent = matrix[:, -recent_days:]
+    median, mad, mean, std, peak, active_days = _rolling_baseline(matrix, recent_days, baseline_days)
+    regular = active_days >= baseline_days // 2
+
+    # Всплеск при регулярном расходе: робастный z-score дня относительно скользящей медианы/MAD
+    # (при нулевом MAD масштабом служит стандартное отклонение). При редком расходе медиана и MAD
+    # нулевые, и обычный заказ дал бы огромный z — там сравниваем с максимумом окна.
+    scale = MAD_SCALE * mad
+    scale = np.where(scale > 0, scale, std)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.where(regular & (scale > 0), (recent - median) / scale, 0.0)
+        sparse_score = np.where(~regular & (peak > 0), recent / peak, 0.0)
+    spike_mask = regular & (z > z_threshold) & (recent > 2 * mean) & (recent > 0)
+    spike_mask |= ~regular & (peak > 0) & (sparse_score > SPARSE_SPIKE_RATIO)
+    score = np.where(regular, z, sparse_score)
+    baseline = np.where(regular, median, peak)
+    spike_rows = np.flatnonzero(spike_mask.any(axis=1))
+    spike_days = np.where(spike_mask[spike_rows], score[spike_rows], -np.inf).argmax(axis=1)
+    spikes = [
+        (row, float(score[row, day]), float(recent[row, day]), float(baseline[row, day]))
+        for row, day in zip(spike_rows, spike_days)
+    ]
+
+    # Провал: стабильный расход в базовом окне и почти нулевой в последние дни
+    base_mean = mean[:, 0]
+    recent_mean = recent.mean(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(base_mean > 0, recent_mean / base_mean, 1.0)
+    drop_rows = np.flatnonzero(regular[:, 0] & (ratio < drop_ratio))
+    drops = [(row, float(1 - ratio[row]), float(recent_mean[row]), float(base_mean[row])) for row in drop_rows]
+    return spikes, drops
+
+
+def detect_ledger_corrections(today, tolerance=1e-6):
+    """
+    Сверяет остатки с журналом операций групповыми запросами. Первое наблюдение
+    материала сохраняется как точка отсчета, изменение расхождения — корректировка.
+    """
+    ledger = ledger_balances()
+    checkpoints = dict(LedgerCheckpoint.objects.values_list('material_id', 'offset'))
+
+    corrections, to_create, changed = [], [], []
+    for material_id, current_quantity in Material.objects.values_list('pk', 'current_quantity'):
+        offset = current_quantity - ledger.get(material_id, 0.0)
+        previous = checkpoints.get(material_id)
+        if previous is None:
+            to_create.append(LedgerCheckpoint(material_id=material_id, offset=offset, checked_on=today))
+        elif abs(offset - previous) > tolerance:
+            corrections.append((material_id, offset - previous))
+            changed.append(LedgerCheckpoint(material_id=material_id, offset=offset, checked_on=today))
+
+    LedgerCheckpoint.objects.bulk_create(to_create, batch_size=500)
+    for checkpoint in changed:
+        LedgerCheckpoint.objects.filter(material_id=checkpoint.material_id).update(
+            offset=checkpoint.offset, checked_on=today
+        )
+    return corrections
+
+
+def scan_anomalies(today=None, z_threshold=4.0, drop_ratio=0.1):
+    """
+    Полный проход по складу текущего шарда; результат пишется в StockAnomaly за today.
+    Расход анализируется по завершенным дням (до вчерашнего включительно).
+    """
+    today = today or date.today()
+    material_ids = list(Material.objects.order_by('pk').values_list('pk', flat=True))
+    history_days = BASELINE_DAYS + RECENT_DAYS
+    matrix = build_usage_matrix(material_ids, {}, days=history_days, end_day=today - timedelta(days=1))
+    spikes, drops = detect_usage_anomalies(matrix, z_threshold=z_threshold, drop_ratio=drop_ratio)
+
+    anomalies = []
+    for row, score, value, baseline in spikes:
+        anomalies.append(StockAnomaly(
+            material_id=material_ids[row], kind=StockAnomaly.Kind.SPIKE, detected_on=today, score=score,
+            details=f"Расход {value:g} за день при обычном {baseline:g}",
+        ))
+    for row, score, value, baseline in drops:
+        anomalies.append(StockAnomaly(
+            material_id=material_ids[row], kind=StockAnomaly.Kind.DROP, detected_on=today, score=score,
+            details=f"Средний расход упал до {value:.2f} в день при обычном {baseline:.2f}",
+        ))
+
+    with shard_atomic():
+        for material_id, delta in detect_ledger_corrections(today):
+            anomalies.append(StockAnomaly(
+                material_id=material_id, kind=StockAnomaly.Kind.CORRECTION, detected_on=today, score=abs(delta),
+                details=f"Остаток изменен на {delta:+g} без записи в журнале операций",
+            ))
+        # Повторный запуск за тот же день заменяет результаты, а не дублирует их
+        StockAnomaly.objects.filter(detected_on=today).exclude(kind=StockAnomaly.Kind.CORRECTION).delete()
+        StockAnomaly.objects.bulk_create(anomalies, batch_size=500, ignore_conflicts=True)
+    return anomalies
+
+
+def recent_anomalies(material_filter, today=None, days=BADGE_DAYS):
+    """Недавние аномалии для бейджей: {material_id: [StockAnomaly, ...]}"""
+    today = today or date.today()
+    result = {}
+    anomalies = StockAnomaly.objects.filter(detected_on__gte=today - timedelta(days=days), **material_filter)
+    for anomaly in anomalies.order_by('-detected_on', '-score'):
+        result.setdefault(anomaly.material_id, []).append(anomaly)
+    return result
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class ForecastingConfig(AppConfig):
     name = 'forecasting'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from materials.sharding import shard_aliases, use_shard
+from forecasting.anomalies import scan_anomalies
+from forecasting.models import StockAnomaly
+
+
+class Command(BaseCommand):
+    help = "Пакетный поиск аномалий расхода и корректировок остатков по всему складу"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--z-threshold', type=float, default=4.0,
+                            help="Порог робастного z-score для всплеска расхода")
+        parser.add_argument('--drop-ratio', type=float, default=0.1,
+                            help="Провал: доля от обычного расхода, ниже которой он считается аномальным")
+
+    def handle(self, *args, **options):
+        found = []
+        for alias in shard_aliases():
+            with use_shard(alias):
+                found += scan_anomalies(z_threshold=options['z_threshold'], drop_ratio=options['drop_ratio'])
+        for kind, label in StockAnomaly.Kind.choices:
+            count = sum(1 for anomaly in found if anomaly.kind == kind)
+            self.stdout.write(f"{label}: {count}")
+        self.stdout.write(self.style.SUCCESS(f"Найдено аномалий: {len(found)}"))
@@ -0,0 +1,49 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from materials.sharding import shard_aliases, use_shard, use_user_shard
+from forecasting.safety_stock import recalculate_thresholds, safety_stock_settings
+
+
+class Command(BaseCommand):
+    help = ("Пересчитывает минимальный порог материалов как страховой запас: "
+            "z(уровень сервиса) × σ дневного расхода × √(срок поставки)")
+
+    def add_arguments(self, parser):
+        defaults = safety_stock_settings()
+        parser.add_argument('--user', help="Только склад указанного пользователя (username)")
+        parser.add_argument('--lead-time', type=int, default=defaults['lead_time_days'],
+                            help=f"Срок поставки, дней (по умолчанию {defaults['lead_time_days']})")
+        parser.add_argument('--service-level', type=float, default=defaults['service_level'],
+                            help=f"Целевой уровень сервиса (по умолчанию {defaults['service_level']})")
+        parser.add_argument('--dry-run', action='store_true', help="Только показать изменения, не сохранять")
+
+    def handle(self, *args, **options):
+        if not 0.5 <= options['service_level'] < 1:
+            raise CommandError("Уровень сервиса должен быть в диапазоне [0.5, 1)")
+        if options['lead_time'] < 1:
+            raise CommandError("Срок поставки должен быть не меньше 1 дня")
+
+        params = {
+            'lead_time_days': options['lead_time'],
+            'service_level': options['service_level'],
+            'dry_run': options['dry_run'],
+        }
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f"Пользователь '{options['user']}' не найден")
+            with use_user_shard(user):
+                changes = recalculate_thresholds({'user': user}, **params)
+        else:
+            changes = []
+            for alias in shard_aliases():
+                with use_shard(alias):
+                    changes += recalculate_thresholds(**params)
+
+        for change in changes:
+            material = change['material']
+            self.stdout.write(f"{material.pk:>8} {material.name[:40]:<40} {change['old']:>10g} → {change['new']:<10g}"
+                              f" (спрос за срок поставки {change['lead_time_mean']:g} ± {change['lead_time_std']:g})")
+        verb = "Будет изменено" if options['dry_run'] else "Изменено"
+        self.stdout.write(self.style.SUCCESS(f"{verb} порогов: {len(changes)}"))
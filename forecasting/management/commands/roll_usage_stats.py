@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from materials.sharding import shard_aliases, use_shard
+from forecasting.model_utils import rebuild_trend_stats, roll_trend_stats
+
+
+class Command(BaseCommand):
+    help = "Ежедневный сдвиг окна статистик тренда расхода (запускать раз в сутки, например из cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help="Пересчитать статистики всех материалов заново")
+
+    def handle(self, *args, **options):
+        total = 0
+        for alias in shard_aliases():
+            with use_shard(alias):
+                total += rebuild_trend_stats() if options['rebuild'] else roll_trend_stats()
+        self.stdout.write(self.style.SUCCESS(f"Статистик обновлено: {total}"))
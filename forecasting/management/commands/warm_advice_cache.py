@@ -0,0 +1,38 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from materials.models import Material
+from materials.sharding import shard_aliases, shard_for_user, use_shard
+from forecasting.model_utils import get_recommendation, get_advice_batch
+
+
+class Command(BaseCommand):
+    help = "Пакетно запрашивает советы ИИ по всем материалам и заполняет кэш советов"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Имя пользователя (по умолчанию — все склады)")
+        parser.add_argument('--days', type=int, default=30, help="Горизонт прогноза в днях")
+        parser.add_argument('--batch-size', type=int, default=20,
+                            help="Сколько материалов упаковывать в один запрос к ИИ")
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"Пользователь '{options['user']}' не найден")
+
+        inputs_list = []
+        for alias in ([shard_for_user(user)] if user else shard_aliases()):
+            with use_shard(alias):
+                materials = Material.objects.order_by('pk')
+                if user:
+                    materials = materials.filter(user=user)
+                for material_id in materials.values_list('pk', flat=True):
+                    data = get_recommendation(material_id, days_to_forecast=options['days'], with_advice=False)
+                    if 'advice_inputs' in data:
+                        inputs_list.append(data['advice_inputs'])
+
+        answers = get_advice_batch(inputs_list, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Советов получено: {len(answers)}"))
@@ -0,0 +1,31 @@
+# Generated by Django 6.0 on 2026-10-19 10:56
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdviceCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True, verbose_name='Хэш входных данных')),
+                ('prompt', models.TextField(verbose_name='Промпт')),
+                ('response', models.TextField(verbose_name='Ответ ИИ')),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Создан')),
+                ('last_used_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Последнее использование')),
+                ('hits', models.PositiveIntegerField(default=0, verbose_name='Попаданий')),
+            ],
+            options={
+                'verbose_name': 'Совет ИИ (кэш)',
+                'verbose_name_plural': 'Советы ИИ (кэш)',
+            },
+        ),
+    ]
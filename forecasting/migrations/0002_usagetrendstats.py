@@ -0,0 +1,30 @@
+# Generated by Django 6.0 on 2026-10-19 11:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forecasting', '0001_initial'),
+        ('materials', '0012_usagehistory_usage_operation_date_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsageTrendStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window_start', models.DateField(verbose_name='Начало окна')),
+                ('window_end', models.DateField(db_index=True, verbose_name='Конец окна')),
+                ('sum_y', models.FloatField(default=0, verbose_name='Σy')),
+                ('sum_xy', models.FloatField(default=0, verbose_name='Σxy')),
+                ('material', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='trend_stats', to='materials.material', verbose_name='Материал')),
+            ],
+            options={
+                'verbose_name': 'Статистика тренда',
+                'verbose_name_plural': 'Статистики тренда',
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 6.0 on 2026-10-19 11:07
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forecasting', '0002_usagetrendstats'),
+        ('materials', '0012_usagehistory_usage_operation_date_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('offset', models.FloatField(default=0, verbose_name='Остаток минус журнал')),
+                ('checked_on', models.DateField(default=django.utils.timezone.localdate, verbose_name='Дата проверки')),
+                ('material', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_checkpoint', to='materials.material', verbose_name='Материал')),
+            ],
+            options={
+                'verbose_name': 'Сверка с журналом',
+                'verbose_name_plural': 'Сверки с журналом',
+            },
+        ),
+        migrations.CreateModel(
+            name='StockAnomaly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('SPIKE', 'Всплеск расхода'), ('DROP', 'Резкое падение расхода'), ('CORR', 'Корректировка остатка без операции')], max_length=5, verbose_name='Тип аномалии')),
+                ('detected_on', models.DateField(default=django.utils.timezone.localdate, verbose_name='Дата обнаружения')),
+                ('score', models.FloatField(default=0, verbose_name='Оценка')),
+                ('details', models.CharField(blank=True, max_length=255, verbose_name='Описание')),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='anomalies', to='materials.material', verbose_name='Материал')),
+            ],
+            options={
+                'verbose_name': 'Аномалия',
+                'verbose_name_plural': 'Аномалии',
+                'ordering': ['-detected_on', '-score'],
+                'indexes': [models.Index(fields=['material', 'detected_on'], name='anomaly_material_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('material', 'kind', 'detected_on'), name='unique_anomaly_per_day')],
+            },
+        ),
+    ]
@@ -1,12 +1,23 @@
 import pandas as pd
 from materials.models import UsageHistory, Material
+from materials.archive import rollup_totals
+from materials.lots import fefo_queue, projected_waste
+from materials.replicas import read_replica
 from sklearn.linear_model import LinearRegression
 import numpy as np
 from datetime import timedelta, date
+import hashlib
+import json
+import re
+import time
 import requests
 import uuid
 import urllib3
 import warnings
+from django.conf import settings
+from django.db.models import F, Sum
+from django.utils import timezone
+from .models import AdviceCache, UsageTrendStats, StockAnomaly
 
 # Отключаем лишние предупреждения в консоли
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -16,7 +27,32 @@ warnings.filterwarnings("ignore", category=UserWarning)
 AUTH_DATA = "MDE5YjJkNjgtNzcxNC03YWM4LWJiYTEtNTAyYzQxOTcyYmRjOjM5MDQyNmM5LTNmY2YtNDZjYi1hOTkwLTIzNTJhOGFjODhiNw=="
 
 
+GIGACHAT_URL = "https://gigachat.devices.sberbank.ru/api/v1/chat/completions"
+
+# Токен живет 30 минут, держим его в памяти процесса чуть меньше этого срока
+_token_cache = {'token': None, 'expires': 0.0}
+TOKEN_LIFETIME = 25 * 60
+
+
 def get_giga_token():
+    """Возвращает Access Token, запрашивая новый только после истечения старого"""
+    now = time.monotonic()
+    if _token_cache['token'] and _token_cache['expires'] > now:
+        return _token_cache['token']
+    token = _request_giga_token()
+    if token:
+        _token_cache['token'] = token
+        _token_cache['expires'] = now + TOKEN_LIFETIME
+    return token
+
+
+def invalidate_giga_token():
+    """Сбрасывает токен в памяти: следующий get_giga_token() запросит новый"""
+    _token_cache['token'] = None
+    _token_cache['expires'] = 0.0
+
+
+def _request_giga_token():
     """Получает Access Token (действует 30 минут)"""
     url = "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
     headers = {
@@ -33,22 +69,32 @@ def get_giga_token():
         return None
 
 
+USAGE_TYPES = [UsageHistory.OperationType.OUT, UsageHistory.OperationType.DISP]
+
+
+@read_replica()
 def get_historical_usage_data(material_id, days=180):
     try:
         material = Material.objects.get(pk=material_id)
     except Material.DoesNotExist:
         return None
-    usage_types = [UsageHistory.OperationType.OUT, UsageHistory.OperationType.DISP]
+    end_day = date.today()
     history_queryset = UsageHistory.objects.filter(
         material=material,
-        operation_type__in=usage_types
+        operation_type__in=USAGE_TYPES
     ).values('operation_date', 'quantity').order_by('operation_date')
-    if not history_queryset:
+    # Заархивированные операции подмешиваем из дневных итогов
+    archived = [
+        {'operation_date': item['day'], 'quantity': item['total_quantity']}
+        for item in rollup_totals({'material': material}, end_day - timedelta(days=days), end_day, USAGE_TYPES)
+    ]
+    rows = list(history_queryset) + archived
+    if not rows:
         return pd.DataFrame(columns=['date', 'usage_qty'])
-    df = pd.DataFrame(list(history_queryset))
+    df = pd.DataFrame(rows)
     df = df.rename(columns={'operation_date': 'date', 'quantity': 'usage_qty'})
     df['date'] = pd.to_datetime(df['date'])
-    df = df.set_index('date')
+    df = df.set_index('date').sort_index()
     daily_data = df['usage_qty'].resample('D').sum().fillna(0)
     end_date = pd.to_datetime('today').normalize()
     start_date = end_date - pd.Timedelta(days=days)
@@ -73,9 +119,453 @@ def predict_usage(df_historical, days_to_predict=30):
     return np.sum(predictions)
 
 
-def get_recommendation(material_id, days_to_forecast=30):
-    df_usage = get_historical_usage_data(material_id, days=180)
-    predicted_usage = predict_usage(df_usage, days_to_forecast)
+# --- ПАКЕТНЫЙ РАСЧЕТ ПО ВСЕМ МАТЕРИАЛАМ ---
+
+def daily_usage_totals(start_day, end_day, material_filter=None):
+    """
+    Дневной расход (OUT + DISP) за период: список (material_id, день, сумма)
+    из журнала операций и дневных итогов архива.
+    """
+    material_filter = material_filter or {}
+    daily_totals = UsageHistory.objects.filter(
+        operation_type__in=USAGE_TYPES,
+        operation_date__range=[start_day, end_day],
+        **material_filter
+    ).values('material', 'operation_date').annotate(total=Sum('quantity')).order_by()
+    archived = rollup_totals(material_filter, start_day, end_day, USAGE_TYPES)
+    return (
+        [(item['material'], item['operation_date'], item['total']) for item in daily_totals]
+        + [(item['material'], item['day'], item['total_quantity']) for item in archived]
+    )
+
+
+def build_usage_matrix(material_ids, material_filter, days=180, end_day=None):
+    """
+    Матрица дневного расхода (материалы × дни) за те же days+1 дней, что и в
+    get_historical_usage_data. Строки идут в порядке material_ids.
+    material_filter ограничивает выборку (например, {'material__user': user}).
+    """
+    end_day = end_day or date.today()
+    start_day = end_day - timedelta(days=days)
+    row_index = {material_id: row for row, material_id in enumerate(material_ids)}
+    matrix = np.zeros((len(material_ids), days + 1))
+
+    rows, cols, values = [], [], []
+    for material_id, day, total in daily_usage_totals(start_day, end_day, material_filter):
+        if material_id in row_index:
+            rows.append(row_index[material_id])
+            cols.append((day - start_day).days)
+            values.append(total)
+    np.add.at(matrix, (rows, cols), values)
+    return matrix
+
+
+def predict_usage_batch(usage_matrix, days_to_predict=30):
+    """
+    Векторный аналог predict_usage: та же линейная регрессия по индексу дня
+    для каждой строки матрицы (в замкнутой форме), отрицательные прогнозы обнуляются.
+    """
+    n_materials, n_days = usage_matrix.shape
+    if n_materials == 0:
+        return np.zeros(0)
+    x = np.arange(n_days)
+    x_centered = x - x.mean()
+    denominator = x_centered @ x_centered
+    slope = usage_matrix @ x_centered / denominator if denominator else np.zeros(n_materials)
+    intercept = usage_matrix.mean(axis=1) - slope * x.mean()
+
+    future = np.arange(n_days, n_days + days_to_predict)
+    predictions = intercept[:, None] + slope[:, None] * future[None, :]
+    predictions[predictions < 0] = 0
+    totals = predictions.sum(axis=1)
+    totals[usage_matrix.sum(axis=1) == 0] = 0.0
+    return totals
+
+
+def get_purchase_plan(user, days_to_forecast=30, only_purchase=True):
+    """
+    План закупок по всем материалам пользователя за один проход: та же логика,
+    что в get_recommendation (прогноз + минимальный порог), но без запроса к ИИ.
+    Возвращает группы по категориям, внутри — материалы по срочности.
+    """
+    materials = list(Material.objects.filter(user=user).select_related('category').order_by('name'))
+
+    # Материалы с актуальной статистикой тренда считаются за O(1), остальные — одной матрицей
+    stats = fresh_trend_stats({'material__user': user})
+    missing_ids = [material.pk for material in materials if material.pk not in stats]
+    batch_predicted = {}
+    if missing_ids:
+        usage_matrix = build_usage_matrix(missing_ids, {'material__user': user}, days=TREND_WINDOW_DAYS)
+        batch_predicted = dict(zip(missing_ids, predict_usage_batch(usage_matrix, days_to_forecast)))
+    predicted = [
+        predict_usage_from_stats(stats[material.pk], days_to_forecast) if material.pk in stats
+        else batch_predicted[material.pk]
+        for material in materials
+    ]
+
+    groups = {}
+    for material, predicted_usage in zip(materials, predicted):
+        current_stock = material.current_quantity
+        recommended_stock = predicted_usage + material.min_threshold
+        action = "PURCHASE" if current_stock < recommended_stock else "NONE"
+        if only_purchase and action != "PURCHASE":
+            continue
+        quantity_delta = max(0, recommended_stock - current_stock)
+        coverage = current_stock / recommended_stock if recommended_stock > 0 else float('inf')
+        category_name = material.category.name if material.category else "Без категории"
+        groups.setdefault(category_name, []).append({
+            'material': material,
+            'current_stock': current_stock,
+            'predicted_usage': round(float(predicted_usage), 2),
+            'recommended_stock': round(float(recommended_stock), 2),
+            'quantity_delta': round(float(quantity_delta), 2),
+            'display_delta': int(np.ceil(quantity_delta)),
+            'action': action,
+            'coverage': coverage,
+            'stock_status_percent': min(100, int(coverage * 100)) if recommended_stock > 0 else 100,
+        })
+
+    plan = []
+    for category_name, items in groups.items():
+        items.sort(key=lambda item: (item['coverage'], -item['quantity_delta']))
+        plan.append({
+            'category': category_name,
+            'items': items,
+            'total_delta': sum(item['display_delta'] for item in items),
+        })
+    # Первой идет категория с самым срочным материалом
+    plan.sort(key=lambda group: group['items'][0]['coverage'])
+    return plan
+
+
+# --- ИНКРЕМЕНТАЛЬНЫЕ СТАТИСТИКИ ТРЕНДА ---
+
+TREND_WINDOW_DAYS = 180
+
+
+def _clipped_linear_sum(intercept, slope, first_x, count):
+    """Σ max(0, intercept + slope·x) для x = first_x … first_x+count-1 без перебора дней"""
+    last_x = first_x + count - 1
+    if slope == 0:
+        return count * max(intercept, 0.0)
+    zero_x = -intercept / slope
+    if slope > 0:
+        low, high = max(first_x, int(np.floor(zero_x)) + 1), last_x
+    else:
+        low, high = first_x, min(last_x, int(np.ceil(zero_x)) - 1)
+    if low > high:
+        return 0.0
+    terms = high - low + 1
+    return terms * intercept + slope * (low + high) * terms / 2
+
+
+def predict_usage_from_stats(stats, days_to_predict=30):
+    """
+    Прогноз по сохраненным Σy и Σxy за O(1). Совпадает с predict_usage
+    по тому же окну: МНК по номеру дня, отрицательные прогнозы обнуляются.
+    """
+    if abs(stats.sum_y) < 1e-9:
+        return 0.0
+    n = stats.n
+    denominator = n * stats.sum_xx - stats.sum_x ** 2
+    slope = (n * stats.sum_xy - stats.sum_x * stats.sum_y) / denominator if denominator else 0.0
+    intercept = (stats.sum_y - slope * stats.sum_x) / n
+    return _clipped_linear_sum(intercept, slope, n, days_to_predict)
+
+
+def fresh_trend_stats(material_filter, today=None):
+    """Статистики, доведенные до сегодняшнего дня: {material_id: UsageTrendStats}"""
+    today = today or date.today()
+    stats = UsageTrendStats.objects.filter(window_end=today, **material_filter)
+    return {item.material_id: item for item in stats}
+
+
+def rebuild_trend_stats(material_ids=None, today=None):
+    """Полный пересчет статистик по окну (для новых материалов или после долгого простоя)"""
+    today = today or date.today()
+    start_day = today - timedelta(days=TREND_WINDOW_DAYS)
+    materials = Material.objects.order_by('pk')
+    if material_ids is not None:
+        materials = materials.filter(pk__in=material_ids)
+    ids = list(materials.values_list('pk', flat=True))
+    if not ids:
+        return 0
+
+    material_filter = {'material_id__in': ids} if len(ids) <= 500 else {}
+    matrix = build_usage_matrix(ids, material_filter, days=TREND_WINDOW_DAYS, end_day=today)
+    sum_y = matrix.sum(axis=1)
+    sum_xy = matrix @ np.arange(TREND_WINDOW_DAYS + 1)
+
+    UsageTrendStats.objects.filter(material_id__in=ids).delete()
+    UsageTrendStats.objects.bulk_create([
+        UsageTrendStats(material_id=material_id, window_start=start_day, window_end=today,
+                        sum_y=float(y), sum_xy=float(xy))
+        for material_id, y, xy in zip(ids, sum_y, sum_xy)
+    ], batch_size=500)
+    return len(ids)
+
+
+def roll_trend_stats(today=None):
+    """
+    Сдвигает окна всех статистик до today: вычитает вышедшие из окна дни,
+    пересчитывает Σxy под новое начало окна (Σxy −= k·Σy) и добавляет новые дни.
+    Материалы без статистик или с очень старым окном пересчитываются целиком.
+    """
+    today = today or date.today()
+    new_start = today - timedelta(days=TREND_WINDOW_DAYS)
+    rolled = 0
+    to_rebuild = list(
+        Material.objects.filter(trend_stats__isnull=True).values_list('pk', flat=True)
+    )
+
+    stale = UsageTrendStats.objects.exclude(window_end=today)
+    for old_end in list(stale.values_list('window_end', flat=True).distinct()):
+        group = {item.material_id: item for item in stale.filter(window_end=old_end)}
+        if old_end > today or (today - old_end).days > TREND_WINDOW_DAYS:
+            to_rebuild.extend(group)
+            continue
+
+        old_start = old_end - timedelta(days=TREND_WINDOW_DAYS)
+        shift = (new_start - old_start).days
+        leaving = daily_usage_totals(old_start, new_start - timedelta(days=1))
+        entering = daily_usage_totals(old_end + timedelta(days=1), today)
+
+        for material_id, day, total in leaving:
+            item = group.get(material_id)
+            if item:
+                item.sum_y -= total
+                item.sum_xy -= (day - old_start).days * total
+        for item in group.values():
+            item.sum_xy -= shift * item.sum_y
+            item.window_start, item.window_end = new_start, today
+        for material_id, day, total in entering:
+            item = group.get(material_id)
+            if item:
+                item.sum_y += total
+                item.sum_xy += (day - new_start).days * total
+
+        UsageTrendStats.objects.bulk_update(group.values(), ['window_start', 'window_end', 'sum_y', 'sum_xy'],
+                                            batch_size=500)
+        rolled += len(group)
+
+    if to_rebuild:
+        rolled += rebuild_trend_stats(to_rebuild, today=today)
+    return rolled
+
+
+def apply_usage_to_trend_stats(material_id, operation_type, operation_date, quantity, sign=1):
+    """
+    Учитывает одну операцию (sign=1) или ее отмену (sign=-1) в статистике материала,
+    если операция расходная и попадает в текущее окно.
+    """
+    if operation_type not in USAGE_TYPES or operation_date is None:
+        return
+    if hasattr(operation_date, 'date'):
+        operation_date = operation_date.date()
+    stats = (UsageTrendStats.objects.filter(material_id=material_id)
+             .values('window_start', 'window_end').first())
+    if not stats or not stats['window_start'] <= operation_date <= stats['window_end']:
+        return
+    x = (operation_date - stats['window_start']).days
+    UsageTrendStats.objects.filter(material_id=material_id, window_start=stats['window_start']).update(
+        sum_y=F('sum_y') + sign * quantity,
+        sum_xy=F('sum_xy') + sign * x * quantity,
+    )
+
+
+# --- КЭШ И ПАКЕТНЫЕ ЗАПРОСЫ К GIGACHAT ---
+
+ADVICE_AI_ERROR = "Ошибка ИИ-анализа. Рекомендуется ручная проверка."
+ADVICE_AI_UNAVAILABLE = "ИИ временно недоступен. Используйте математический прогноз."
+
+
+def build_advice_inputs(material_name, trend, risk_level, anomaly_detected,
+                        current_stock, predicted_usage, display_delta):
+    """Нормализованные входные данные промпта — от них зависит ответ ИИ"""
+    return {
+        'name': ' '.join(str(material_name).split()),
+        'trend': trend,
+        'risk': risk_level,
+        'anomaly': anomaly_detected,
+        'stock': round(float(current_stock), 2),
+        'prediction': round(float(predicted_usage), 2),
+        'delta': int(display_delta),
+    }
+
+
+def advice_cache_key(inputs):
+    """Хэш нормализованных входных данных (ключ кэша советов)"""
+    raw = json.dumps(inputs, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def build_advice_prompt(inputs):
+    return (
+        f"Ты — эксперт-аналитик склада. Данные по '{inputs['name']}':\n"
+        f"- Тренд: {inputs['trend']}, Риск брака: {inputs['risk']}, Аномалии: {inputs['anomaly']}.\n"
+        f"- Запас: {inputs['stock']}, Прогноз: {inputs['prediction']}.\n"
+        f"Дай краткий совет (до 20 слов): нужно ли закупать {inputs['delta']} ед. и есть ли риски."
+    )
+
+
+def build_batch_advice_prompt(inputs_list):
+    """Один промпт на несколько материалов; ответы ожидаются в виде пронумерованного списка"""
+    lines = [
+        "Ты — эксперт-аналитик склада. Ниже пронумерованы данные по нескольким материалам.",
+        "Для каждого дай краткий совет (до 20 слов): нужно ли закупать указанное количество и есть ли риски.",
+        "Ответь строго списком в формате 'N. совет', по одной строке на материал, без пропусков.",
+    ]
+    for number, inputs in enumerate(inputs_list, start=1):
+        lines.append(
+            f"{number}. '{inputs['name']}': тренд {inputs['trend']}, риск брака {inputs['risk']}, "
+            f"аномалии {inputs['anomaly']}, запас {inputs['stock']}, прогноз {inputs['prediction']}, "
+            f"закупка {inputs['delta']} ед."
+        )
+    return "\n".join(lines)
+
+
+BATCH_ANSWER_RE = re.compile(r'^\s*(\d+)\s*[.):\-]\s*(.+?)\s*$', re.MULTILINE)
+
+
+def parse_batch_advice(raw_text, count):
+    """Разбирает пронумерованный ответ ИИ; отсутствующие номера возвращаются как None"""
+    answers = [None] * count
+    for match in BATCH_ANSWER_RE.finditer(raw_text):
+        number = int(match.group(1))
+        if 1 <= number <= count and answers[number - 1] is None:
+            answers[number - 1] = match.group(2).replace('*', '').strip()
+    return answers
+
+
+class GigaChatAuthError(Exception):
+    """GigaChat отклонил токен (401): он отозван или истек раньше срока"""
+
+
+def ask_gigachat(prompt, token):
+    """Один запрос chat completion; исключения пробрасываются вызывающему коду"""
+    headers = {'Content-Type': 'application/json', 'Authorization': f'Bearer {token}'}
+    payload = {"model": "GigaChat", "messages": [{"role": "user", "content": prompt}], "temperature": 0.5}
+    res = requests.post(GIGACHAT_URL, headers=headers, json=payload, verify=False)
+    if res.status_code == 401:
+        raise GigaChatAuthError(res.text)
+    return res.json()['choices'][0]['message']['content']
+
+
+def ask_gigachat_with_refresh(prompt, token):
+    """
+    Запрос с одним повтором на новом токене, если текущий отклонен.
+    Возвращает (ответ, токен) — токен для следующих запросов пакета.
+    """
+    try:
+        return ask_gigachat(prompt, token), token
+    except GigaChatAuthError:
+        invalidate_giga_token()
+        token = get_giga_token()
+        if not token:
+            raise
+        return ask_gigachat(prompt, token), token
+
+
+def _advice_ttl():
+    return timedelta(seconds=getattr(settings, 'GIGACHAT_ADVICE_TTL', 24 * 60 * 60))
+
+
+def get_cached_advice(keys):
+    """Возвращает {ключ: ответ} для найденных и не устаревших записей кэша"""
+    fresh_since = timezone.now() - _advice_ttl()
+    entries = AdviceCache.objects.filter(key__in=keys, created_at__gte=fresh_since)
+    found = dict(entries.values_list('key', 'response'))
+    if found:
+        AdviceCache.objects.filter(key__in=found.keys()).update(
+            hits=F('hits') + 1, last_used_at=timezone.now()
+        )
+    return found
+
+
+def store_advice(items):
+    """Сохраняет пары (ключ, промпт, ответ) и вытесняет устаревшие/лишние записи"""
+    now = timezone.now()
+    for key, prompt, response in items:
+        AdviceCache.objects.update_or_create(
+            key=key,
+            defaults={'prompt': prompt, 'response': response, 'created_at': now, 'last_used_at': now},
+        )
+    evict_advice_cache()
+
+
+def evict_advice_cache():
+    """Удаляет записи старше TTL и самые давно использованные сверх лимита размера"""
+    AdviceCache.objects.filter(created_at__lt=timezone.now() - _advice_ttl()).delete()
+    max_size = getattr(settings, 'GIGACHAT_ADVICE_CACHE_SIZE', 5000)
+    overflow = list(
+        AdviceCache.objects.order_by('-last_used_at').values_list('pk', flat=True)[max_size:]
+    )
+    if overflow:
+        AdviceCache.objects.filter(pk__in=overflow).delete()
+
+
+def get_advice(inputs):
+    """Совет ИИ для одного материала с использованием кэша"""
+    return get_advice_batch([inputs], batch_size=1)[0]
+
+
+def get_advice_batch(inputs_list, batch_size=20):
+    """
+    Советы ИИ для нескольких материалов. Попадания берутся из кэша,
+    промахи упаковываются в один запрос chat completion на batch_size материалов.
+    """
+    keys = [advice_cache_key(inputs) for inputs in inputs_list]
+    cached = get_cached_advice(set(keys))
+    results = [cached.get(key) for key in keys]
+
+    # Одинаковые ситуации внутри пакета спрашиваем один раз
+    missing = {}
+    for index, key in enumerate(keys):
+        if results[index] is None:
+            missing.setdefault(key, []).append(index)
+    if not missing:
+        return results
+
+    token = get_giga_token()
+    if not token:
+        return [text if text is not None else ADVICE_AI_UNAVAILABLE for text in results]
+
+    missing_keys = list(missing)
+    for start in range(0, len(missing_keys), batch_size):
+        chunk = missing_keys[start:start + batch_size]
+        chunk_inputs = [inputs_list[missing[key][0]] for key in chunk]
+        if len(chunk) == 1:
+            prompt = build_advice_prompt(chunk_inputs[0])
+        else:
+            prompt = build_batch_advice_prompt(chunk_inputs)
+        try:
+            raw_text, token = ask_gigachat_with_refresh(prompt, token)
+        except Exception:
+            answers = [None] * len(chunk)
+        else:
+            if len(chunk) == 1:
+                answers = [raw_text.replace('*', '')]
+            else:
+                answers = parse_batch_advice(raw_text, len(chunk))
+
+        to_store = []
+        for key, inputs, answer in zip(chunk, chunk_inputs, answers):
+            if answer:
+                to_store.append((key, build_advice_prompt(inputs), answer))
+            for index in missing[key]:
+                results[index] = answer or ADVICE_AI_ERROR
+        if to_store:
+            store_advice(to_store)
+    return results
+
+
+def get_recommendation(material_id, days_to_forecast=30, with_advice=True):
+    df_usage = get_historical_usage_data(material_id, days=TREND_WINDOW_DAYS)
+    stats = fresh_trend_stats({'material_id': material_id}).get(material_id)
+    if stats is not None:
+        predicted_usage = predict_usage_from_stats(stats, days_to_forecast)
+    else:
+        predicted_usage = predict_usage(df_usage, days_to_forecast)
 
     try:
         material = Material.objects.get(pk=material_id)
@@ -99,8 +589,16 @@ def get_recommendation(material_id, days_to_forecast=30):
     trend = "растущий" if last_month_usage > overall_avg else "стабильный"
 
     # 3. ОЦЕНКА РИСКА БРАКА
+    # По партиям: сколько истечет раньше, чем будет израсходовано при прогнозном темпе (FEFO)
     risk_level = "Низкий"
-    if material.expiration_date:
+    lots = list(fefo_queue(material))
+    if lots:
+        waste, first_expiry = projected_waste(lots, predicted_usage / max(days_to_forecast, 1))
+        if waste > 0:
+            days_to_expiry = (first_expiry - date.today()).days
+            level = "Критический" if days_to_expiry < 14 else "Средний"
+            risk_level = f"{level} (≈{waste:.2f} {material.unit} истечет до использования)"
+    elif material.expiration_date:
         days_to_expiry = (material.expiration_date - date.today()).days
         if days_to_expiry < 14:
             risk_level = "Критический (срок истекает)"
@@ -108,35 +606,25 @@ def get_recommendation(material_id, days_to_forecast=30):
             risk_level = "Средний"
 
     # 4. ВЫЯВЛЕНИЕ АНОМАЛИЙ
+    # Сначала берем результат пакетного детектора за последнюю неделю, затем простое правило
     anomaly_detected = "Нет"
-    if predicted_usage < 1 and current_stock < material.min_threshold:
+    stored_anomaly = StockAnomaly.objects.filter(
+        material=material, detected_on__gte=date.today() - timedelta(days=7)
+    ).order_by('-detected_on', '-score').first()
+    if stored_anomaly:
+        anomaly_detected = f"{stored_anomaly.get_kind_display()}: {stored_anomaly.details}"
+    elif predicted_usage < 1 and current_stock < material.min_threshold:
         anomaly_detected = "Резкое снижение остатков без зафиксированного расхода"
 
     quantity_delta = max(0, recommended_stock - current_stock)
     display_delta = int(np.ceil(quantity_delta))
     action = "PURCHASE" if current_stock < recommended_stock else "NONE"
 
-    token = get_giga_token()
-    if token:
-        prompt = (
-            f"Ты — эксперт-аналитик склада. Данные по '{material.name}':\n"
-            f"- Тренд: {trend}, Риск брака: {risk_level}, Аномалии: {anomaly_detected}.\n"
-            f"- Запас: {current_stock}, Прогноз: {round(predicted_usage, 2)}.\n"
-            f"Дай краткий совет (до 20 слов): нужно ли закупать {display_delta} ед. и есть ли риски."
-        )
-
-        headers = {'Content-Type': 'application/json', 'Authorization': f'Bearer {token}'}
-        payload = {"model": "GigaChat", "messages": [{"role": "user", "content": prompt}], "temperature": 0.5}
-
-        try:
-            res = requests.post("https://gigachat.devices.sberbank.ru/api/v1/chat/completions",
-                                headers=headers, json=payload, verify=False)
-            raw_text = res.json()['choices'][0]['message']['content']
-            recommendation_text = raw_text.replace('*', '')
-        except Exception:
-            recommendation_text = "Ошибка ИИ-анализа. Рекомендуется ручная проверка."
-    else:
-        recommendation_text = "ИИ временно недоступен. Используйте математический прогноз."
+    advice_inputs = build_advice_inputs(
+        material.name, trend, risk_level, anomaly_detected,
+        current_stock, predicted_usage, display_delta,
+    )
+    recommendation_text = get_advice(advice_inputs) if with_advice else None
 
     return {
         'material_name': material.name,
@@ -144,6 +632,7 @@ def get_recommendation(material_id, days_to_forecast=30):
         'predicted_usage': round(predicted_usage, 2),
         'recommended_stock': round(recommended_stock, 2),
         'recommendation_text': recommendation_text,
+        'advice_inputs': advice_inputs,
         'action': action,
         'days_to_forecast': days_to_forecast,
         'quantity_delta': round(quantity_delta, 2),
@@ -153,4 +642,4 @@ def get_recommendation(material_id, days_to_forecast=30):
         'trend': trend,
         'chart_labels': chart_labels,
         'chart_data': chart_data,
-    }
\ No newline at end of file
+    }
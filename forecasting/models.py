@@ -1,3 +1,103 @@
 from django.db import models
+from django.utils import timezone
 
-# Create your models here.
+
+class AdviceCache(models.Model):
+    """
+    Кэш ответов GigaChat. Ключ — хэш нормализованных входных данных промпта,
+    поэтому одинаковая ситуация по материалу не требует повторного запроса к ИИ.
+    """
+    key = models.CharField(max_length=64, unique=True, verbose_name="Хэш входных данных")
+    prompt = models.TextField(verbose_name="Промпт")
+    response = models.TextField(verbose_name="Ответ ИИ")
+    created_at = models.DateTimeField(default=timezone.now, db_index=True, verbose_name="Создан")
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True, verbose_name="Последнее использование")
+    hits = models.PositiveIntegerField(default=0, verbose_name="Попаданий")
+
+    class Meta:
+        verbose_name = "Совет ИИ (кэш)"
+        verbose_name_plural = "Советы ИИ (кэш)"
+
+    def __str__(self):
+        return f"{self.key[:12]}… ({self.hits})"
+
+
+class UsageTrendStats(models.Model):
+    """
+    Достаточные статистики линейного тренда расхода материала за скользящее окно
+    (те же 181 день, что и в get_historical_usage_data). x — номер дня от window_start,
+    y — расход за день; n, Σx и Σx² определяются самим окном, Σy и Σxy хранятся.
+    """
+    material = models.OneToOneField('materials.Material', on_delete=models.CASCADE,
+                                    related_name='trend_stats', verbose_name="Материал")
+    window_start = models.DateField(verbose_name="Начало окна")
+    window_end = models.DateField(db_index=True, verbose_name="Конец окна")
+    sum_y = models.FloatField(default=0, verbose_name="Σy")
+    sum_xy = models.FloatField(default=0, verbose_name="Σxy")
+
+    class Meta:
+        verbose_name = "Статистика тренда"
+        verbose_name_plural = "Статистики тренда"
+
+    def __str__(self):
+        return f"{self.material_id}: {self.window_start} — {self.window_end}"
+
+    @property
+    def n(self):
+        return (self.window_end - self.window_start).days + 1
+
+    @property
+    def sum_x(self):
+        return self.n * (self.n - 1) / 2
+
+    @property
+    def sum_xx(self):
+        return (self.n - 1) * self.n * (2 * self.n - 1) / 6
+
+
+class StockAnomaly(models.Model):
+    """Аномалия, найденная пакетным детектором (см. forecasting/anomalies.py)"""
+
+    class Kind(models.TextChoices):
+        SPIKE = 'SPIKE', 'Всплеск расхода'
+        DROP = 'DROP', 'Резкое падение расхода'
+        CORRECTION = 'CORR', 'Корректировка остатка без операции'
+
+    material = models.ForeignKey('materials.Material', on_delete=models.CASCADE,
+                                 related_name='anomalies', verbose_name="Материал")
+    kind = models.CharField(max_length=5, choices=Kind.choices, verbose_name="Тип аномалии")
+    detected_on = models.DateField(default=timezone.localdate, verbose_name="Дата обнаружения")
+    score = models.FloatField(default=0, verbose_name="Оценка")
+    details = models.CharField(max_length=255, blank=True, verbose_name="Описание")
+
+    class Meta:
+        verbose_name = "Аномалия"
+        verbose_name_plural = "Аномалии"
+        ordering = ['-detected_on', '-score']
+        indexes = [
+            models.Index(fields=['material', 'detected_on'], name='anomaly_material_date_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['material', 'kind', 'detected_on'], name='unique_anomaly_per_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.material_id} | {self.get_kind_display()} ({self.detected_on})"
+
+
+class LedgerCheckpoint(models.Model):
+    """
+    Расхождение остатка материала с журналом операций на момент последней проверки.
+    Изменение расхождения означает, что остаток правили вручную без записи в журнал.
+    """
+    material = models.OneToOneField('materials.Material', on_delete=models.CASCADE,
+                                    related_name='ledger_checkpoint', verbose_name="Материал")
+    offset = models.FloatField(default=0, verbose_name="Остаток минус журнал")
+    checked_on = models.DateField(default=timezone.localdate, verbose_name="Дата проверки")
+
+    class Meta:
+        verbose_name = "Сверка с журналом"
+        verbose_name_plural = "Сверки с журналом"
+
+    def __str__(self):
+        return f"{self.material_id}: {self.offset}"
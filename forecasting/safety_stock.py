@@ -0,0 +1,91 @@
+import math
+from datetime import date, timedelta
+from statistics import NormalDist
+
+import numpy as np
+from django.conf import settings
+
+from materials.index import invalidate_material_index
+from materials.models import Material
+from .model_utils import TREND_WINDOW_DAYS, build_usage_matrix
+
+# Материалы с расходом реже, чем в этом числе дней окна, не пересчитываются: дисперсия ненадежна
+MIN_ACTIVE_DAYS = 5
+THRESHOLD_TOLERANCE = 1e-6
+
+
+def safety_stock_settings():
+    return {
+        'lead_time_days': getattr(settings, 'SAFETY_STOCK_LEAD_TIME_DAYS', 7),
+        'service_level': getattr(settings, 'SAFETY_STOCK_SERVICE_LEVEL', 0.95),
+    }
+
+
+def compute_safety_stock(matrix, lead_time_days, service_level):
+    """
+    Страховой запас по матрице дневного расхода (материалы × дни) за один векторный проход.
+    Спрос за срок поставки L: среднее μ·L, дисперсия σ²·L; запас = z·σ·√L,
+    где z — квантиль нормального распределения для уровня сервиса.
+    Возвращает (запас, среднее за срок поставки, ст. отклонение за срок поставки, активных дней).
+    """
+    z = NormalDist().inv_cdf(service_level)
+    daily_mean = matrix.mean(axis=1)
+    daily_var = matrix.var(axis=1, ddof=1) if matrix.shape[1] > 1 else np.zeros(matrix.shape[0])
+    lead_time_mean = daily_mean * lead_time_days
+    lead_time_std = np.sqrt(daily_var * lead_time_days)
+    active_days = (matrix > 0).sum(axis=1)
+    return z * lead_time_std, lead_time_mean, lead_time_std, active_days
+
+
+def _round_threshold(value, unit):
+    # Штучный товар округляем вверх до целого, весовой и объемный — до сотых
+    if unit == 'шт.':
+        return float(math.ceil(value - THRESHOLD_TOLERANCE))
+    return round(value, 2)
+
+
+def recalculate_thresholds(material_filter=None, lead_time_days=None, service_level=None,
+                           dry_run=False, today=None):
+    """
+    Пересчитывает min_threshold материалов текущего шарда как страховой запас.
+    Возвращает список изменений (материал, старый порог, новый порог, μ·L, σ·L);
+    без dry_run сохраняет их через bulk_update.
+    """
+    defaults = safety_stock_settings()
+    lead_time_days = lead_time_days or defaults['lead_time_days']
+    service_level = service_level or defaults['service_level']
+    material_filter = material_filter or {}
+    today = today or date.today()
+
+    materials = list(
+        Material.objects.filter(**material_filter)
+        .only('pk', 'user', 'name', 'unit', 'min_threshold').order_by('pk')
+    )
+    if not materials:
+        return []
+    usage_filter = {f'material__{key}': value for key, value in material_filter.items()}
+    matrix = build_usage_matrix([material.pk for material in materials], usage_filter,
+                                days=TREND_WINDOW_DAYS, end_day=today - timedelta(days=1))
+    safety, lead_mean, lead_std, active_days = compute_safety_stock(matrix, lead_time_days, service_level)
+
+    changes = []
+    for row, material in enumerate(materials):
+        if active_days[row] < MIN_ACTIVE_DAYS:
+            continue
+        new_threshold = _round_threshold(float(safety[row]), material.unit)
+        if abs(new_threshold - material.min_threshold) <= THRESHOLD_TOLERANCE:
+            continue
+        changes.append({
+            'material': material,
+            'old': material.min_threshold,
+            'new': new_threshold,
+            'lead_time_mean': round(float(lead_mean[row]), 2),
+            'lead_time_std': round(float(lead_std[row]), 2),
+        })
+
+    if not dry_run and changes:
+        for change in changes:
+            change['material'].min_threshold = change['new']
+        Material.objects.bulk_update([change['material'] for change in changes], ['min_threshold'], batch_size=500)
+        invalidate_material_index(change['material'].user_id for change in changes)
+    return changes
@@ -0,0 +1,23 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from materials.models import UsageHistory
+from materials.signals import ledger_signals_active, usage_contribution
+from .model_utils import apply_usage_to_trend_stats
+
+
+@receiver(post_save, sender=UsageHistory)
+def update_trend_stats_on_save(sender, instance, created, **kwargs):
+    if not ledger_signals_active():
+        return
+    # Прежний вклад операции запоминает materials.signals.remember_previous_usage
+    previous = getattr(instance, '_previous_usage', None)
+    if previous:
+        apply_usage_to_trend_stats(*previous, sign=-1)
+    apply_usage_to_trend_stats(*usage_contribution(instance))
+
+
+@receiver(post_delete, sender=UsageHistory)
+def update_trend_stats_on_delete(sender, instance, **kwargs):
+    if ledger_signals_active():
+        apply_usage_to_trend_stats(*usage_contribution(instance), sign=-1)
@@ -1,3 +1,26 @@
-from django.test import TestCase
+import numpy as np
+from django.test import SimpleTestCase
 
-# Create your tests here.
+from .anomalies import BASELINE_DAYS, RECENT_DAYS, detect_usage_anomalies
+
+
+class UsageAnomalyTests(SimpleTestCase):
+    days = BASELINE_DAYS + RECENT_DAYS
+
+    def test_intermittent_demand_is_not_a_spike(self):
+        # Стационарный редкий спрос: ~0.25 заказа в день по 1–5 единиц
+        rng = np.random.default_rng(7)
+        orders = rng.random((3000, self.days)) < 0.25
+        matrix = np.where(orders, rng.integers(1, 6, size=(3000, self.days)), 0).astype(float)
+        spikes, drops = detect_usage_anomalies(matrix)
+        self.assertLess(len(spikes), 30)
+
+    def test_spikes_detected_for_regular_and_intermittent_demand(self):
+        rng = np.random.default_rng(11)
+        regular = rng.normal(10, 1, self.days).clip(min=0)
+        regular[-2] = 60
+        intermittent = np.zeros(self.days)
+        intermittent[::5] = 3
+        intermittent[-1] = 40
+        spikes, drops = detect_usage_anomalies(np.vstack([regular, intermittent]))
+        self.assertEqual(sorted((row, value) for row, _, value, _ in spikes), [(0, 60.0), (1, 40.0)])
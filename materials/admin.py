@@ -1,5 +1,95 @@
-from django.contrib import admin
-from .models import Material, UsageHistory, Category
-admin.site.register(Category)
-admin.site.register(Material)
-admin.site.register(UsageHistory)
\ No newline at end of file
+from django.contrib import admin, messages
+from .models import Material, UsageHistory, Category, UsageDailyRollup, UsageArchive, UserShard, AnalyticsCube, Lot
+from .index import invalidate_material_index
+from .ledger import ledger_balance
+
+
+@admin.register(Category)
+class CategoryAdmin(admin.ModelAdmin):
+    list_display = ('name', 'user')
+    list_select_related = ('user',)
+    search_fields = ('name',)
+    raw_id_fields = ('user',)
+    show_full_result_count = False
+
+
+@admin.register(Material)
+class MaterialAdmin(admin.ModelAdmin):
+    list_display = ('name', 'article_number', 'category', 'user', 'current_quantity',
+                    'min_threshold', 'unit', 'expiration_date')
+    list_select_related = ('category', 'user')
+    list_filter = ('unit',)
+    search_fields = ('name', '=article_number')
+    autocomplete_fields = ('category',)
+    raw_id_fields = ('user',)
+    show_full_result_count = False
+    list_per_page = 50
+    actions = ['recalculate_quantity']
+
+    @admin.action(description="Пересчитать остаток по журналу операций")
+    def recalculate_quantity(self, request, queryset):
+        # Один UPDATE с подзапросами вместо загрузки и сохранения каждого материала
+        user_ids = list(queryset.values_list('user_id', flat=True).distinct())
+        updated = queryset.update(current_quantity=ledger_balance())
+        invalidate_material_index(user_ids)
+        self.message_user(request, f"Остаток пересчитан для материалов: {updated}", messages.SUCCESS)
+
+
+@admin.register(UsageHistory)
+class UsageHistoryAdmin(admin.ModelAdmin):
+    list_display = ('operation_date', 'material', 'operation_type', 'quantity', 'user')
+    list_select_related = ('material', 'user')
+    list_filter = ('operation_type',)
+    date_hierarchy = 'operation_date'
+    search_fields = ('=material__article_number', 'material__name')
+    autocomplete_fields = ('material',)
+    raw_id_fields = ('user',)
+    ordering = ('-operation_date', '-id')
+    show_full_result_count = False
+    list_per_page = 50
+
+
+@admin.register(UsageDailyRollup)
+class UsageDailyRollupAdmin(admin.ModelAdmin):
+    list_display = ('day', 'material', 'operation_type', 'total_quantity', 'operations_count')
+    list_select_related = ('material',)
+    list_filter = ('operation_type',)
+    date_hierarchy = 'day'
+    autocomplete_fields = ('material',)
+    show_full_result_count = False
+
+
+@admin.register(UsageArchive)
+class UsageArchiveAdmin(admin.ModelAdmin):
+    list_display = ('user', 'year', 'part', 'row_count', 'first_date', 'last_date', 'created_at')
+    list_select_related = ('user',)
+    list_filter = ('year',)
+    exclude = ('payload',)
+    raw_id_fields = ('user',)
+
+
+@admin.register(UserShard)
+class UserShardAdmin(admin.ModelAdmin):
+    list_display = ('user', 'alias')
+    list_select_related = ('user',)
+    list_filter = ('alias',)
+    raw_id_fields = ('user',)
+
+
+@admin.register(AnalyticsCube)
+class AnalyticsCubeAdmin(admin.ModelAdmin):
+    list_display = ('user', 'category', 'period', 'period_start', 'operation_type', 'total_quantity',
+                    'operations_count')
+    list_select_related = ('user', 'category')
+    list_filter = ('period', 'operation_type')
+    raw_id_fields = ('user', 'category')
+    show_full_result_count = False
+
+
+@admin.register(Lot)
+class LotAdmin(admin.ModelAdmin):
+    list_display = ('material', 'received_on', 'expiration_date', 'initial_quantity', 'remaining_quantity')
+    list_select_related = ('material',)
+    list_filter = ('expiration_date',)
+    raw_id_fields = ('material', 'operation')
+    show_full_result_count = False
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class MaterialsConfig(AppConfig):
     name = 'materials'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
@@ -0,0 +1,160 @@
+# materials/archive.py
+
+import gzip
+import json
+from collections import defaultdict
+from datetime import date
+
+from django.db import connections
+from django.db.models import Count, Max
+from django.db.models.functions import ExtractYear
+
+from .models import UsageHistory, UsageDailyRollup, UsageArchive
+from .sharding import shard_atomic
+from .signals import ledger_signals_muted
+
+# Колонки, которые сохраняются в архиве (порядок важен для выгрузки)
+ARCHIVE_COLUMNS = ['id', 'material_id', 'user_id', 'date', 'operation_date',
+                   'operation_type', 'quantity', 'comment']
+
+DELETE_CHUNK = 500
+
+
+def _encode_rows(rows):
+    """Упаковывает строки в колоночный JSON и сжимает gzip"""
+    data = {column: [] for column in ARCHIVE_COLUMNS}
+    for row in rows:
+        for column in ARCHIVE_COLUMNS:
+            value = row[column]
+            if isinstance(value, date):
+                value = value.isoformat()
+            data[column].append(value)
+    raw = json.dumps({'columns': ARCHIVE_COLUMNS, 'data': data}, ensure_ascii=False)
+    return gzip.compress(raw.encode('utf-8'))
+
+
+def _decode_rows(payload):
+    """Обратная операция: распаковывает архив и по одной отдает строки-словари"""
+    content = json.loads(gzip.decompress(bytes(payload)).decode('utf-8'))
+    columns = content['columns']
+    data = content['data']
+    for values in zip(*(data[column] for column in columns)):
+        yield dict(zip(columns, values))
+
+
+def iter_archived_usage(user=None, year=None):
+    """
+    Потоково отдает архивные операции (словари с колонками ARCHIVE_COLUMNS).
+    В памяти одновременно находится только одна часть архива.
+    """
+    archives = UsageArchive.objects.all()
+    if user is not None:
+        archives = archives.filter(user=user)
+    if year is not None:
+        archives = archives.filter(year=year)
+    for archive_id in archives.values_list('pk', flat=True):
+        payload = UsageArchive.objects.values_list('payload', flat=True).get(pk=archive_id)
+        yield from _decode_rows(payload)
+
+
+def _merge_rollups(rows):
+    """Добавляет дневные итоги архивируемых строк к уже существующим"""
+    totals = defaultdict(lambda: [0.0, 0])
+    for row in rows:
+        key = (row['material_id'], row['operation_date'], row['operation_type'])
+        totals[key][0] += row['quantity']
+        totals[key][1] += 1
+
+    material_ids = {key[0] for key in totals}
+    days = [key[1] for key in totals]
+    existing = {
+        (rollup.material_id, rollup.day, rollup.operation_type): rollup
+        for rollup in UsageDailyRollup.objects.filter(
+            material_id__in=material_ids, day__range=[min(days), max(days)]
+        )
+    }
+
+    to_create, to_update = [], []
+    for key, (quantity, count) in totals.items():
+        rollup = existing.get(key)
+        if rollup:
+            rollup.total_quantity += quantity
+            rollup.operations_count += count
+            to_update.append(rollup)
+        else:
+            to_create.append(UsageDailyRollup(
+                material_id=key[0], day=key[1], operation_type=key[2],
+                total_quantity=quantity, operations_count=count,
+            ))
+    UsageDailyRollup.objects.bulk_create(to_create, batch_size=DELETE_CHUNK)
+    UsageDailyRollup.objects.bulk_update(to_update, ['total_quantity', 'operations_count'],
+                                         batch_size=DELETE_CHUNK)
+
+
+def archive_usage_before(cutoff, dry_run=False):
+    """
+    Переносит операции с operation_date < cutoff в сжатые архивы (пользователь × год)
+    и заменяет их дневными итогами. Возвращает список (user_id, год, число строк).
+    """
+    old_rows = UsageHistory.objects.filter(operation_date__lt=cutoff)
+    groups = (old_rows.annotate(year=ExtractYear('operation_date'))
+              .values('material__user', 'year')
+              .annotate(rows=Count('id'))
+              .order_by('material__user', 'year'))
+
+    report = []
+    for group in groups:
+        owner_id, year = group['material__user'], group['year']
+        report.append((owner_id, year, group['rows']))
+        if dry_run:
+            continue
+
+        with shard_atomic():
+            rows = list(
+                old_rows.filter(material__user=owner_id, operation_date__year=year)
+                .order_by('operation_date', 'id')
+                .values(*ARCHIVE_COLUMNS)
+            )
+            if not rows:
+                continue
+            last_part = (UsageArchive.objects.filter(user_id=owner_id, year=year)
+                         .aggregate(last=Max('part'))['last'] or 0)
+            UsageArchive.objects.create(
+                user_id=owner_id, year=year, part=last_part + 1,
+                row_count=len(rows),
+                first_date=rows[0]['operation_date'],
+                last_date=rows[-1]['operation_date'],
+                payload=_encode_rows(rows),
+            )
+            _merge_rollups(rows)
+
+            # Учет не меняется: операции остаются в дневных итогах
+            ids = [row['id'] for row in rows]
+            with ledger_signals_muted():
+                for start in range(0, len(ids), DELETE_CHUNK):
+                    UsageHistory.objects.filter(pk__in=ids[start:start + DELETE_CHUNK]).delete()
+    return report
+
+
+def compact_usage_table(using='default'):
+    """Освобождает место после удаления строк и обновляет статистику планировщика"""
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('VACUUM')
+            cursor.execute('ANALYZE')
+        elif connection.vendor == 'postgresql':
+            cursor.execute(f'VACUUM ANALYZE {UsageHistory._meta.db_table}')
+        else:
+            cursor.execute(f'ANALYZE TABLE {UsageHistory._meta.db_table}')
+
+
+def rollup_totals(material_filter, start_date, end_date, operation_types=None):
+    """
+    Дневные итоги из архива за период: список словарей с material, day,
+    operation_type, total_quantity. material_filter — условия на материал (например, {'material__user': user}).
+    """
+    rollups = UsageDailyRollup.objects.filter(day__range=[start_date, end_date], **material_filter)
+    if operation_types is not None:
+        rollups = rollups.filter(operation_type__in=operation_types)
+    return rollups.values('material', 'day', 'operation_type', 'total_quantity')
@@ -0,0 +1,29 @@
+# materials/checks.py
+
+from django.core.checks import Error, Warning, register
+
+from core.cache import shared_cache_configured
+
+from .replicas import replica_map
+
+SHARED_CACHE_HINT = "Настройте CACHES на Redis или файловый кэш (см. core/settings.py)."
+
+
+@register()
+def shared_cache_check(app_configs, **kwargs):
+    """Реплики и данные, которые один процесс пишет для других, требуют общего кэша"""
+    if shared_cache_configured():
+        return []
+    if not replica_map():
+        return [Warning(
+            "Кэш локален для процесса: индекс материалов не узнает о записях других процессов, "
+            "сводка, пересчитанная командой refresh_staff_dashboard, не видна серверу.",
+            hint=SHARED_CACHE_HINT,
+            id='materials.W001',
+        )]
+    return [Error(
+        "Реплики для чтения включены, но кэш локален для процесса: метки записи (read-your-writes) "
+        "и время обновления реплики не видны другим процессам.",
+        hint=SHARED_CACHE_HINT,
+        id='materials.E001',
+    )]
@@ -0,0 +1,174 @@
+# materials/cube.py
+
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+
+from .models import AnalyticsCube, Material, UsageDailyRollup, UsageHistory
+from .sharding import shard_atomic
+
+PERIOD_TRUNC = {
+    AnalyticsCube.Period.WEEK: TruncWeek,
+    AnalyticsCube.Period.MONTH: TruncMonth,
+}
+
+
+def period_start(day, period):
+    """Первый день недели (понедельник) или месяца, в который попадает day"""
+    if period == AnalyticsCube.Period.WEEK:
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def period_end(start, period):
+    """Последний день периода, начинающегося в start"""
+    if period == AnalyticsCube.Period.WEEK:
+        return start + timedelta(days=6)
+    return (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+
+
+def period_starts(start_date, end_date, period):
+    """Начала всех периодов, пересекающихся с интервалом [start_date, end_date]"""
+    starts = []
+    current = period_start(start_date, period)
+    while current <= end_date:
+        starts.append(current)
+        current = period_end(current, period) + timedelta(days=1)
+    return starts
+
+
+def _bump_cell(user_id, category_id, period, start, operation_type, quantity, count):
+    cell = {
+        'user_id': user_id, 'category_id': category_id, 'period': period,
+        'period_start': start, 'operation_type': operation_type,
+    }
+    updated = AnalyticsCube.objects.filter(**cell).update(
+        total_quantity=F('total_quantity') + quantity,
+        operations_count=F('operations_count') + count,
+    )
+    if not updated:
+        AnalyticsCube.objects.create(total_quantity=quantity, operations_count=count, **cell)
+
+
+def apply_usage_to_cube(material_id, operation_type, operation_date, quantity, sign=1):
+    """Учитывает в кубе добавление (sign=1) или удаление (sign=-1) одной операции"""
+    owner = Material.objects.filter(pk=material_id).values('user_id', 'category_id').first()
+    if owner is None:
+        return
+    for period in AnalyticsCube.Period.values:
+        _bump_cell(owner['user_id'], owner['category_id'], period, period_start(operation_date, period),
+                   operation_type, sign * quantity, sign)
+
+
+def _aggregate_cells(material_filter):
+    """
+    Группирует журнал операций и дневные итоги архива по ячейкам куба.
+    Возвращает {(user_id, category_id, period, period_start, operation_type): [количество, операций]}.
+    """
+    cells = defaultdict(lambda: [0.0, 0])
+    sources = [
+        (UsageHistory.objects.filter(**material_filter), 'operation_date', Sum('quantity'), Count('pk')),
+        (UsageDailyRollup.objects.filter(**material_filter), 'day', Sum('total_quantity'), Sum('operations_count')),
+    ]
+    for queryset, date_field, quantity, count in sources:
+        for period, trunc in PERIOD_TRUNC.items():
+            rows = queryset.annotate(bucket=trunc(date_field)).values(
+                'material__user', 'material__category', 'bucket', 'operation_type',
+            ).annotate(quantity=quantity, count=count).order_by()
+            for row in rows:
+                key = (row['material__user'], row['material__category'], period,
+                       row['bucket'], row['operation_type'])
+                cells[key][0] += row['quantity'] or 0
+                cells[key][1] += row['count'] or 0
+    return cells
+
+
+def move_material_in_cube(material_id, old_category_id, new_category_id):
+    """Переносит вклад материала в кубе из старой категории в новую при ее смене"""
+    cells = _aggregate_cells({'material_id': material_id})
+    for (user_id, _, period, start, operation_type), (quantity, count) in cells.items():
+        _bump_cell(user_id, old_category_id, period, start, operation_type, -quantity, -count)
+        _bump_cell(user_id, new_category_id, period, start, operation_type, quantity, count)
+
+
+def remove_material_from_cube(material_id):
+    """
+    Вычитает весь вклад удаляемого материала (журнал и архивные итоги) группами по ячейкам,
+    а не по одной операции при каскадном удалении.
+    """
+    cells = _aggregate_cells({'material_id': material_id})
+    for (user_id, category_id, period, start, operation_type), (quantity, count) in cells.items():
+        _bump_cell(user_id, category_id, period, start, operation_type, -quantity, -count)
+
+
+def merge_category_into_uncategorized(category):
+    """
+    При удалении категории материалы остаются без категории (SET_NULL через update,
+    без сигналов), поэтому ячейки категории переносятся в ячейки «без категории».
+    """
+    for cell in AnalyticsCube.objects.filter(category=category):
+        _bump_cell(cell.user_id, None, cell.period, cell.period_start, cell.operation_type,
+                   cell.total_quantity, cell.operations_count)
+
+
+def rebuild_cube(user=None):
+    """Полностью пересчитывает куб текущего шарда (или одного пользователя) из журнала и архива"""
+    material_filter = {'material__user': user} if user is not None else {}
+    cells = _aggregate_cells(material_filter)
+    rows = [
+        AnalyticsCube(user_id=user_id, category_id=category_id, period=period, period_start=start,
+                      operation_type=operation_type, total_quantity=quantity, operations_count=count)
+        for (user_id, category_id, period, start, operation_type), (quantity, count) in cells.items()
+    ]
+    with shard_atomic():
+        cube = AnalyticsCube.objects.all()
+        if user is not None:
+            cube = cube.filter(user=user)
+        cube.delete()
+        AnalyticsCube.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def cube_report(user, period, start_date, end_date, category=None, uncategorized=False):
+    """
+    Читает куб за интервал: временной ряд по периодам и разбивка по категориям.
+    Объем чтения зависит от числа периодов и категорий, а не от числа операций.
+    category — фильтр детализации; uncategorized=True — только материалы без категории.
+    """
+    starts = period_starts(start_date, end_date, period)
+    cells = AnalyticsCube.objects.filter(
+        user=user, period=period, period_start__range=[starts[0], starts[-1]],
+    )
+    if uncategorized:
+        cells = cells.filter(category__isnull=True)
+    elif category is not None:
+        cells = cells.filter(category=category)
+
+    series = {start: {'income': 0.0, 'usage': 0.0, 'writeoff': 0.0, 'operations': 0} for start in starts}
+    by_category = {}
+    key_by_type = {
+        UsageHistory.OperationType.IN: 'income',
+        UsageHistory.OperationType.OUT: 'usage',
+        UsageHistory.OperationType.DISP: 'writeoff',
+    }
+    rows = cells.values('period_start', 'category', 'category__name', 'operation_type').annotate(
+        quantity=Sum('total_quantity'), count=Sum('operations_count'),
+    ).order_by()
+    for row in rows:
+        key = key_by_type.get(row['operation_type'])
+        if key is None:
+            continue
+        point = series[row['period_start']]
+        point[key] += row['quantity']
+        point['operations'] += row['count']
+        totals = by_category.setdefault(row['category'], {
+            'category_id': row['category'], 'name': row['category__name'] or 'Без категории',
+            'income': 0.0, 'usage': 0.0, 'writeoff': 0.0, 'operations': 0,
+        })
+        totals[key] += row['quantity']
+        totals['operations'] += row['count']
+
+    categories = sorted(by_category.values(), key=lambda item: item['usage'] + item['writeoff'], reverse=True)
+    return [{'period_start': start, **values} for start, values in series.items()], categories
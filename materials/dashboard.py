@@ -0,0 +1,145 @@
+# materials/dashboard.py
+
+import time
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from .cube import period_start
+from .index import SOON_DAYS
+from .models import AnalyticsCube, Material, UsageHistory
+from .replicas import read_replica
+from .sharding import shard_aliases, use_shard
+
+DASHBOARD_CACHE_KEY = 'staff_dashboard'
+DASHBOARD_LOCK_KEY = 'staff_dashboard:building'
+DASHBOARD_LOCK_SECONDS = 60
+
+OPERATION_KEYS = {
+    UsageHistory.OperationType.IN: 'income',
+    UsageHistory.OperationType.OUT: 'usage',
+    UsageHistory.OperationType.DISP: 'writeoff',
+}
+
+SORT_FIELDS = ('username', 'materials', 'critical', 'low', 'expiring', 'income', 'usage', 'writeoff', 'operations')
+
+
+def dashboard_settings():
+    return {
+        'weeks': getattr(settings, 'STAFF_DASHBOARD_WEEKS', 4),
+        'timeout': getattr(settings, 'STAFF_DASHBOARD_CACHE_TIMEOUT', 15 * 60),
+    }
+
+
+def _empty_row(user):
+    return {
+        'user_id': user['id'], 'username': user['username'], 'is_active': user['is_active'],
+        'shard': None, 'materials': 0, 'out': 0, 'low': 0, 'expired': 0, 'expiring': 0, 'critical': 0,
+        'income': 0.0, 'usage': 0.0, 'writeoff': 0.0, 'operations': 0,
+        'week_income': 0.0, 'week_usage': 0.0, 'week_writeoff': 0.0,
+    }
+
+
+def _material_totals(today):
+    """Счетчики материалов по пользователям текущего шарда — один запрос с GROUP BY"""
+    out = Q(current_quantity=0)
+    expired = Q(expiration_date__lt=today)
+    return (
+        Material.objects.values('user_id').annotate(
+            materials=Count('pk'),
+            out=Count('pk', filter=out),
+            low=Count('pk', filter=Q(current_quantity__gt=0, current_quantity__lt=F('min_threshold'))),
+            expired=Count('pk', filter=expired),
+            expiring=Count('pk', filter=Q(expiration_date__range=[today, today + timedelta(days=SOON_DAYS)])),
+            critical=Count('pk', filter=out | expired),
+        ).order_by()
+    )
+
+
+def _operation_totals(first_week, current_week):
+    """Объем операций по пользователям и типам из недельных ячеек куба — один запрос с GROUP BY"""
+    return (
+        AnalyticsCube.objects.filter(period=AnalyticsCube.Period.WEEK, period_start__gte=first_week)
+        .values('user_id', 'operation_type').annotate(
+            quantity=Sum('total_quantity'),
+            count=Sum('operations_count'),
+            week_quantity=Sum('total_quantity', filter=Q(period_start=current_week)),
+        ).order_by()
+    )
+
+
+def build_dashboard(today=None, weeks=None):
+    """
+    Сводка по всем складам: для каждого шарда два агрегирующих запроса (материалы и
+    недельный куб операций), затем один запрос пользователей. Объем работы зависит
+    от числа пользователей и недель, а не от числа операций в журнале.
+    """
+    today = today or date.today()
+    weeks = weeks or dashboard_settings()['weeks']
+    current_week = period_start(today, AnalyticsCube.Period.WEEK)
+    first_week = current_week - timedelta(weeks=weeks - 1)
+
+    rows = {user['id']: _empty_row(user) for user in User.objects.values('id', 'username', 'is_active')}
+    with read_replica():
+        for alias in shard_aliases():
+            with use_shard(alias):
+                for totals in _material_totals(today):
+                    row = rows.get(totals.pop('user_id'))
+                    if row is not None:
+                        row.update(totals, shard=alias)
+                for totals in _operation_totals(first_week, current_week):
+                    row = rows.get(totals['user_id'])
+                    key = OPERATION_KEYS.get(totals['operation_type'])
+                    if row is None or key is None:
+                        continue
+                    row[key] += totals['quantity'] or 0.0
+                    row[f'week_{key}'] += totals['week_quantity'] or 0.0
+                    row['operations'] += totals['count'] or 0
+
+    summary = {
+        field: sum(row[field] for row in rows.values())
+        for field in ('materials', 'out', 'low', 'expired', 'expiring', 'critical',
+                      'income', 'usage', 'writeoff', 'operations')
+    }
+    summary['users'] = len(rows)
+    summary['warehouses'] = sum(1 for row in rows.values() if row['materials'])
+    return {
+        'rows': sorted(rows.values(), key=lambda row: row['username'].lower()),
+        'summary': summary,
+        'first_week': first_week,
+        'weeks': weeks,
+        'generated_at': timezone.now(),
+    }
+
+
+def refresh_dashboard(today=None):
+    """Пересчитывает сводку и кладет ее в кэш (вызывается командой refresh_staff_dashboard)"""
+    dashboard = build_dashboard(today)
+    cache.set(DASHBOARD_CACHE_KEY, dashboard, dashboard_settings()['timeout'])
+    return dashboard
+
+
+def get_dashboard():
+    """
+    Сводка из общего кэша (ее обновляет команда refresh_staff_dashboard). При промахе
+    считает один запрос, остальные в это время ждут его результата, а не считают заново.
+    """
+    dashboard = cache.get(DASHBOARD_CACHE_KEY)
+    if dashboard is not None:
+        return dashboard
+    if cache.add(DASHBOARD_LOCK_KEY, True, DASHBOARD_LOCK_SECONDS):
+        try:
+            return refresh_dashboard()
+        finally:
+            cache.delete(DASHBOARD_LOCK_KEY)
+    deadline = time.monotonic() + DASHBOARD_LOCK_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(0.2)
+        dashboard = cache.get(DASHBOARD_CACHE_KEY)
+        if dashboard is not None:
+            return dashboard
+    return refresh_dashboard()
@@ -0,0 +1,129 @@
+# materials/events.py
+
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.utils.module_loading import import_string
+
+# Если подписчик не успевает забирать события, новые отбрасываются (страница все равно получит следующее)
+SUBSCRIBER_QUEUE_SIZE = 100
+KEEPALIVE_SECONDS = 15
+
+
+def stock_channel(user_id):
+    return f'stock:{user_id}'
+
+
+class InProcessBroker:
+    """
+    Брокер событий в памяти процесса. Подходит для одного ASGI-процесса;
+    для нескольких процессов используйте RedisBroker.
+    """
+
+    def __init__(self, **options):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(self._deliver, queue, message)
+
+    @staticmethod
+    def _deliver(queue, message):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            pass
+
+    async def subscribe(self, channel):
+        """Асинхронный генератор сообщений канала; None — пауза для keep-alive"""
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE))
+        with self._lock:
+            self._subscribers[channel].add(subscriber)
+        try:
+            while True:
+                try:
+                    yield await asyncio.wait_for(subscriber[1].get(), timeout=KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            with self._lock:
+                self._subscribers[channel].discard(subscriber)
+                if not self._subscribers[channel]:
+                    del self._subscribers[channel]
+
+
+class RedisBroker:
+    """
+    Брокер через Redis pub/sub (или совместимую локальную замену) — для нескольких процессов.
+    Требует пакет redis: OPTIONS = {'url': 'redis://localhost:6379/0'}.
+    """
+
+    def __init__(self, url='redis://localhost:6379/0', **options):
+        import redis
+        import redis.asyncio
+        self._client = redis.Redis.from_url(url)
+        self._async_client = redis.asyncio.Redis.from_url(url)
+
+    def publish(self, channel, message):
+        self._client.publish(channel, message)
+
+    async def subscribe(self, channel):
+        pubsub = self._async_client.pubsub()
+        await pubsub.subscribe(channel)
+        try:
+            while True:
+                item = await pubsub.get_message(ignore_subscribe_messages=True, timeout=KEEPALIVE_SECONDS)
+                yield item['data'].decode('utf-8') if item else None
+        finally:
+            await pubsub.unsubscribe(channel)
+            await pubsub.aclose()
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def live_updates_available(request):
+    """
+    Поток событий держит соединение открытым, поэтому включается только под ASGI:
+    под WSGI StreamingHttpResponse дочитывает асинхронный генератор до конца
+    перед отправкой, и запрос навсегда занимает поток, ничего не отдав клиенту.
+    """
+    return getattr(settings, 'STOCK_EVENTS_ENABLED', True) and isinstance(request, ASGIRequest)
+
+
+def get_broker():
+    """Брокер из настройки STOCK_EVENTS_BROKER (создается один раз на процесс)"""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                config = getattr(settings, 'STOCK_EVENTS_BROKER', {})
+                backend = import_string(config.get('BACKEND', 'materials.events.InProcessBroker'))
+                _broker = backend(**config.get('OPTIONS', {}))
+    return _broker
+
+
+def publish_stock_change(material, deleted=False):
+    """Отправляет компактное событие об изменении остатка владельцу склада"""
+    if material.user_id is None:
+        return
+    if deleted:
+        event = {'id': material.pk, 'deleted': True}
+    else:
+        status = material.get_status()
+        event = {
+            'id': material.pk,
+            'qty': material.current_quantity,
+            'row_class': status['row_class'],
+            'stock': status['stock'],
+            'expiry': status['expiry_status'],
+        }
+    get_broker().publish(stock_channel(material.user_id), json.dumps(event))
@@ -18,11 +18,23 @@ class MaterialForm(forms.ModelForm):
             'expiration_date'
         ]
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # При наличии партий срок годности материала — ближайший срок среди них
+        if self.instance.pk and self.instance.lots.exists():
+            self.fields['expiration_date'].disabled = True
+            self.fields['expiration_date'].help_text = "Определяется партиями (ближайший срок)"
+
 
 class UsageHistoryForm(forms.ModelForm):
     """
     Форма для регистрации операций прихода/расхода (IN/OUT/DISP).
     """
+    lot_expiration_date = forms.DateField(
+        required=False, label="Срок годности партии",
+        widget=forms.DateInput(attrs={'type': 'date'}),
+        help_text="Только для прихода. Расход и списание идут с партий, срок которых истекает раньше.",
+    )
 
     class Meta:
         model = UsageHistory
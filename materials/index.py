@@ -0,0 +1,294 @@
+# materials/index.py
+
+import copy
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from core.cache import atomic_incr_configured
+
+from .models import Material
+
+logger = logging.getLogger(__name__)
+
+NO_CATEGORY = -1
+NO_EXPIRY = np.iinfo(np.int64).max
+SOON_DAYS = 30
+
+# Коды статусов в массивах индекса (совпадают по смыслу с Material.get_status)
+STOCK_OK, STOCK_LOW, STOCK_OUT = 0, 1, 2
+EXPIRY_NONE, EXPIRY_OK, EXPIRY_SOON, EXPIRY_EXPIRED = 0, 1, 2, 3
+STOCK_NAMES = {STOCK_OK: 'ok', STOCK_LOW: 'low', STOCK_OUT: 'out'}
+EXPIRY_NAMES = {EXPIRY_NONE: None, EXPIRY_OK: 'ok', EXPIRY_SOON: 'soon', EXPIRY_EXPIRED: 'expired'}
+
+FIELDS = ('pk', 'category_id', 'current_quantity', 'min_threshold', 'expiration_date', 'name', 'article_number')
+# Массивы numpy индекса (названия хранятся отдельным списком names)
+COLUMNS = ('ids', 'category', 'quantity', 'threshold', 'expiry', 'search_text')
+
+
+def _version_key(user_id):
+    return f'material_index_version:{user_id}'
+
+
+def _row_values(values):
+    pk, category_id, quantity, threshold, expiration_date, name, article = values
+    return (
+        pk,
+        NO_CATEGORY if category_id is None else category_id,
+        quantity,
+        threshold,
+        NO_EXPIRY if expiration_date is None else expiration_date.toordinal(),
+        name,
+        f'{name}\n{article or ""}'.lower(),
+    )
+
+
+class MaterialIndex:
+    """
+    Колонки материалов одного пользователя в массивах numpy: фильтры, счетчики
+    и сортировка списка — маски и argsort без обращения к базе.
+    Опубликованный индекс не изменяется: upsert и remove возвращают новый.
+    """
+
+    def __init__(self, rows, version):
+        columns = list(zip(*map(_row_values, rows))) if rows else [()] * 7
+        self.ids = np.array(columns[0], dtype=np.int64)
+        self.category = np.array(columns[1], dtype=np.int64)
+        self.quantity = np.array(columns[2], dtype=np.float64)
+        self.threshold = np.array(columns[3], dtype=np.float64)
+        self.expiry = np.array(columns[4], dtype=np.int64)
+        self.names = list(columns[5])
+        self.search_text = np.array(columns[6], dtype=str)
+        self.version = version
+        self._positions = {int(pk): row for row, pk in enumerate(self.ids)}
+        self._order = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def order(self):
+        """Порядок строк по названию (как order_by('name')), кэшируется до изменения индекса"""
+        if self._order is None:
+            self._order = np.argsort(np.array(self.names, dtype=str), kind='stable')
+        return self._order
+
+    def stock_status(self):
+        status = np.full(len(self), STOCK_OK, dtype=np.int8)
+        status[(self.quantity > 0) & (self.quantity < self.threshold)] = STOCK_LOW
+        status[self.quantity == 0] = STOCK_OUT
+        return status
+
+    def expiry_status(self, today):
+        days_left = self.expiry - today.toordinal()
+        status = np.full(len(self), EXPIRY_OK, dtype=np.int8)
+        status[days_left <= SOON_DAYS] = EXPIRY_SOON
+        status[days_left < 0] = EXPIRY_EXPIRED
+        status[self.expiry == NO_EXPIRY] = EXPIRY_NONE
+        return status
+
+    def query(self, today, category_id=None, qty_status=None, expiry=None, search=None):
+        """
+        Фильтры material_list маской. Возвращает (ids в порядке названия,
+        статусы остатка и срока для них, счетчики по отфильтрованным строкам).
+        """
+        stock = self.stock_status()
+        expiry_status = self.expiry_status(today)
+        mask = np.ones(len(self), dtype=bool)
+
+        if search:
+            mask &= np.char.find(self.search_text, search.lower()) >= 0
+        if category_id is not None:
+            mask &= self.category == category_id
+        if qty_status == 'low':
+            mask &= stock == STOCK_LOW
+        elif qty_status == 'out':
+            mask &= stock == STOCK_OUT
+        if expiry == 'expired':
+            mask &= expiry_status == EXPIRY_EXPIRED
+        elif expiry == 'expires_soon':
+            mask &= expiry_status == EXPIRY_SOON
+        elif expiry == 'no_expiry':
+            mask &= expiry_status == EXPIRY_NONE
+
+        rows = self.order()[mask[self.order()]]
+        stock, expiry_status = stock[rows], expiry_status[rows]
+        counts = {
+            'total': len(rows),
+            'critical': int(((stock == STOCK_OUT) | (expiry_status == EXPIRY_EXPIRED)).sum()),
+            'below_threshold': int((stock == STOCK_LOW).sum()),
+            'soon_expiry': int((expiry_status == EXPIRY_SOON).sum()),
+        }
+        return self.ids[rows], stock, expiry_status, counts
+
+    def _copy(self):
+        clone = copy.copy(self)
+        for name in COLUMNS:
+            setattr(clone, name, getattr(self, name).copy())
+        clone.names = list(self.names)
+        clone._positions = dict(self._positions)
+        clone._order = None
+        return clone
+
+    def upsert(self, values):
+        """
+        Новый индекс с добавленной или измененной строкой. Сам индекс не меняется:
+        его в это время может читать query() в другом потоке.
+        """
+        row_values = _row_values(values)
+        index = self._copy()
+        row = index._positions.get(row_values[0])
+        if row is None:
+            row = len(index)
+            index.ids = np.append(index.ids, row_values[0])
+            index.category = np.append(index.category, row_values[1])
+            index.quantity = np.append(index.quantity, row_values[2])
+            index.threshold = np.append(index.threshold, row_values[3])
+            index.expiry = np.append(index.expiry, row_values[4])
+            index.names.append(row_values[5])
+            index.search_text = np.append(index.search_text, row_values[6])
+            index._positions[row_values[0]] = row
+        else:
+            index.category[row], index.quantity[row], index.threshold[row], index.expiry[row] = row_values[1:5]
+            index.names[row] = row_values[5]
+            if len(row_values[6]) > index.search_text.itemsize // 4:
+                index.search_text = index.search_text.astype(f'<U{len(row_values[6])}')
+            index.search_text[row] = row_values[6]
+        return index
+
+    def remove(self, pk):
+        """Новый индекс без строки материала pk (как и upsert, не меняет текущий)"""
+        row = self._positions.get(pk)
+        if row is None:
+            return self
+        index = copy.copy(self)
+        for name in COLUMNS:
+            setattr(index, name, np.delete(getattr(self, name), row))
+        index.names = self.names[:row] + self.names[row + 1:]
+        index._positions = {int(material_id): position for position, material_id in enumerate(index.ids)}
+        index._order = None
+        return index
+
+    def matches(self, rows):
+        """Совпадает ли индекс со строками из базы (для выборочной сверки)"""
+        fresh = MaterialIndex(rows, self.version)
+        order, fresh_order = np.argsort(self.ids), np.argsort(fresh.ids)
+        return all(
+            np.array_equal(getattr(self, name)[order], getattr(fresh, name)[fresh_order])
+            for name in COLUMNS
+        )
+
+
+class MaterialIndexRegistry:
+    """
+    Индексы пользователей в памяти процесса с вытеснением LRU. Версия индекса
+    пользователя хранится в общем для процессов кэше (CACHES): запись в другом процессе
+    увеличивает ее, и устаревший локальный индекс перестраивается при следующем обращении.
+    """
+
+    def __init__(self):
+        self._indexes = OrderedDict()
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _max_users():
+        return getattr(settings, 'MATERIAL_INDEX_MAX_USERS', 256)
+
+    @staticmethod
+    def _current_version(user_id):
+        version = cache.get(_version_key(user_id))
+        if version is None:
+            # Начальная версия от времени: после вытеснения ключа из кэша не совпадет со старой
+            cache.add(_version_key(user_id), time.time_ns(), None)
+            version = cache.get(_version_key(user_id))
+        return version
+
+    @staticmethod
+    def _load_rows(user_id):
+        return list(Material.objects.filter(user_id=user_id).values_list(*FIELDS))
+
+    def get(self, user_id):
+        version = self._current_version(user_id)
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is not None and index.version == version:
+                self._indexes.move_to_end(user_id)
+                verify = random.random() < getattr(settings, 'MATERIAL_INDEX_VERIFY_RATE', 0.0)
+                if not verify:
+                    return index
+
+        rows = self._load_rows(user_id)
+        if index is not None and index.version == version:
+            # Выборочная сверка с базой: расхождение значит, что запись прошла в обход сигналов
+            if index.matches(rows):
+                return index
+            logger.warning("Индекс материалов пользователя %s разошелся с базой, перестраиваем", user_id)
+
+        index = MaterialIndex(rows, version)
+        with self._lock:
+            self._indexes[user_id] = index
+            self._indexes.move_to_end(user_id)
+            while len(self._indexes) > self._max_users():
+                self._indexes.popitem(last=False)
+        return index
+
+    def _bump_version(self, user_id):
+        try:
+            return cache.incr(_version_key(user_id))
+        except ValueError:
+            return None
+
+    def apply(self, user_id, pk, values=None):
+        """Изменение одного материала: values — строка FIELDS, None — удаление"""
+        if not atomic_incr_configured():
+            # Неатомарный incr (get + set) может выдать двум процессам одну версию, и каждый
+            # применил бы только свою дельту. Без дельт смена версии лишь заставляет всех
+            # перестроить индекс, а это корректно и при гонке: новую версию видят после обоих коммитов.
+            self.invalidate(user_id)
+            return
+        new_version = self._bump_version(user_id)
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is None:
+                return
+            # Если между нашими версиями писал другой процесс — дельты мало, индекс перестроится
+            if new_version is None or index.version != new_version - 1:
+                del self._indexes[user_id]
+                return
+            # Копия при записи: потоки, уже получившие индекс, дочитывают прежнюю версию
+            index = index.remove(pk) if values is None else index.upsert(values)
+            index.version = new_version
+            self._indexes[user_id] = index
+
+    def invalidate(self, user_id):
+        """Для изменений в обход сигналов (update, bulk_update, bulk_create)"""
+        self._bump_version(user_id)
+        with self._lock:
+            self._indexes.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+
+registry = MaterialIndexRegistry()
+
+
+def get_material_index(user):
+    return registry.get(user.pk)
+
+
+def invalidate_material_index(user_ids):
+    for user_id in set(user_ids):
+        if user_id is not None:
+            registry.invalidate(user_id)
+
+
+def material_row(material):
+    """Строка индекса из экземпляра (в порядке FIELDS)"""
+    return tuple(getattr(material, field) for field in FIELDS)
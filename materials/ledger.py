@@ -0,0 +1,46 @@
+# materials/ledger.py
+
+from django.db.models import Case, F, FloatField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import UsageHistory, UsageDailyRollup
+
+
+def _signed(quantity_field):
+    """Приход — со знаком плюс, расход и списание — со знаком минус"""
+    return Case(
+        When(operation_type=UsageHistory.OperationType.IN, then=F(quantity_field)),
+        default=-F(quantity_field),
+        output_field=FloatField(),
+    )
+
+
+def ledger_balance():
+    """
+    Выражение для аннотации/обновления Material: остаток по журналу операций
+    (включая заархивированные дневные итоги), считается подзапросами без загрузки строк.
+    """
+    history = (UsageHistory.objects.filter(material=OuterRef('pk'))
+               .order_by().values('material')
+               .annotate(total=Sum(_signed('quantity'))).values('total'))
+    archived = (UsageDailyRollup.objects.filter(material=OuterRef('pk'))
+                .order_by().values('material')
+                .annotate(total=Sum(_signed('total_quantity'))).values('total'))
+    return (Coalesce(Subquery(history, output_field=FloatField()), Value(0.0))
+            + Coalesce(Subquery(archived, output_field=FloatField()), Value(0.0)))
+
+
+def ledger_balances(material_filter=None):
+    """
+    Остатки по журналу для многих материалов сразу: {material_id: остаток}.
+    Два группирующих запроса вместо подзапроса на каждый материал.
+    """
+    material_filter = material_filter or {}
+    balances = {}
+    history = (UsageHistory.objects.filter(**material_filter).order_by()
+               .values('material').annotate(total=Sum(_signed('quantity'))))
+    archived = (UsageDailyRollup.objects.filter(**material_filter).order_by()
+                .values('material').annotate(total=Sum(_signed('total_quantity'))))
+    for item in list(history) + list(archived):
+        balances[item['material']] = balances.get(item['material'], 0.0) + (item['total'] or 0.0)
+    return balances
@@ -0,0 +1,98 @@
+# materials/lots.py
+
+from datetime import date
+
+from django.db.models import F, Sum
+
+from .models import Lot
+
+# Погрешность сравнения остатков (количества хранятся во FloatField)
+QUANTITY_EPSILON = 1e-9
+
+
+def fefo_queue(material):
+    """Непустые партии материала в порядке расходования: раньше истекает — раньше уходит"""
+    return Lot.objects.filter(material=material, remaining_quantity__gt=0).order_by(
+        F('expiration_date').asc(nulls_last=True), 'received_on', 'pk',
+    )
+
+
+def receive_lot(material, quantity, received_on=None, expiration_date=None, operation=None):
+    """Создает партию по приходу"""
+    return Lot.objects.create(
+        material=material, operation=operation, received_on=received_on or date.today(),
+        expiration_date=expiration_date, initial_quantity=quantity, remaining_quantity=quantity,
+    )
+
+
+def consume_fefo(material, quantity):
+    """
+    Списывает quantity с партий в порядке FEFO. Читаются и обновляются только
+    расходуемые партии: очередь идет по индексу и обрывается, как только объем набран.
+    Возвращает список (партия, списано). Вызывать внутри transaction.atomic().
+    """
+    allocations = []
+    left = quantity
+    for lot in fefo_queue(material).select_for_update().iterator(chunk_size=20):
+        if left <= QUANTITY_EPSILON:
+            break
+        taken = min(lot.remaining_quantity, left)
+        lot.remaining_quantity -= taken
+        left -= taken
+        allocations.append((lot, taken))
+    if left > QUANTITY_EPSILON:
+        raise ValueError(f"Недостаточно остатка в партиях: не хватает {left:g}")
+    Lot.objects.bulk_update([lot for lot, _ in allocations], ['remaining_quantity'])
+    return allocations
+
+
+def reconcile_lots(material):
+    """
+    Приводит сумму остатков партий к material.current_quantity. Излишек остатка
+    (склад до появления партий, правка остатка вручную) оформляется партией со сроком
+    материала, недостача списывается по FEFO.
+    """
+    in_lots = fefo_queue(material).aggregate(total=Sum('remaining_quantity'))['total'] or 0.0
+    difference = material.current_quantity - in_lots
+    if difference > QUANTITY_EPSILON:
+        receive_lot(material, difference, expiration_date=material.expiration_date)
+    elif difference < -QUANTITY_EPSILON:
+        consume_fefo(material, -difference)
+    return difference
+
+
+def refresh_expiration_date(material):
+    """
+    Срок годности материала — ближайший срок среди непустых партий.
+    Меняет только экземпляр; возвращает True, если срок изменился и его нужно сохранить.
+    """
+    expiration_date = (
+        fefo_queue(material).filter(expiration_date__isnull=False)
+        .values_list('expiration_date', flat=True).first()
+    )
+    if expiration_date == material.expiration_date:
+        return False
+    material.expiration_date = expiration_date
+    return True
+
+
+def projected_waste(lots, daily_usage, today=None):
+    """
+    Сколько единиц истечет до использования, если расход идет по FEFO со скоростью daily_usage.
+    lots — непустые партии в порядке fefo_queue. Возвращает (объем, ближайший срок такой партии).
+    """
+    today = today or date.today()
+    consumed = 0.0
+    waste = 0.0
+    first_expiry = None
+    for lot in lots:
+        if lot.expiration_date is None:
+            break
+        # К сроку партии успеет уйти не больше, чем расход за оставшиеся дни
+        capacity = max(0.0, daily_usage * (lot.expiration_date - today).days - consumed)
+        used = min(lot.remaining_quantity, capacity)
+        consumed += used
+        if lot.remaining_quantity - used > QUANTITY_EPSILON:
+            waste += lot.remaining_quantity - used
+            first_expiry = first_expiry or lot.expiration_date
+    return waste, first_expiry
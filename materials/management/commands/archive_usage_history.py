@@ -0,0 +1,43 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from materials.archive import archive_usage_before, compact_usage_table
+from materials.sharding import shard_aliases, use_shard
+
+
+class Command(BaseCommand):
+    help = "Переносит старые операции в сжатый архив (пользователь × год), сохраняя дневные итоги"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=365,
+                            help="Архивировать операции старше указанного числа дней (по умолчанию 365)")
+        parser.add_argument('--before', help="Явная граница в формате ГГГГ-ММ-ДД (вместо --days)")
+        parser.add_argument('--dry-run', action='store_true', help="Только показать, что будет перенесено")
+        parser.add_argument('--no-vacuum', action='store_true', help="Не выполнять VACUUM/ANALYZE после переноса")
+
+    def handle(self, *args, **options):
+        if options['before']:
+            try:
+                cutoff = date.fromisoformat(options['before'])
+            except ValueError:
+                raise CommandError("Дата --before должна быть в формате ГГГГ-ММ-ДД")
+        else:
+            cutoff = date.today() - timedelta(days=options['days'])
+
+        total = 0
+        for alias in shard_aliases():
+            with use_shard(alias):
+                report = archive_usage_before(cutoff, dry_run=options['dry_run'])
+            shard_total = 0
+            for owner_id, year, rows in report:
+                shard_total += rows
+                self.stdout.write(f"[{alias}] Пользователь {owner_id}, {year} год: {rows} операций")
+            if shard_total and not options['dry_run'] and not options['no_vacuum']:
+                compact_usage_table(using=alias)
+            total += shard_total
+
+        if options['dry_run']:
+            self.stdout.write(f"Будет заархивировано операций: {total} (граница {cutoff})")
+            return
+        self.stdout.write(self.style.SUCCESS(f"Заархивировано операций: {total} (граница {cutoff})"))
@@ -0,0 +1,38 @@
+import csv
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from materials.archive import ARCHIVE_COLUMNS, iter_archived_usage
+from materials.replicas import read_replica
+from materials.sharding import shard_aliases, shard_for_user, use_shard
+
+
+class Command(BaseCommand):
+    help = "Потоково выгружает архивные операции в CSV (для экспорта и аудита)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Имя пользователя (по умолчанию — все)")
+        parser.add_argument('--year', type=int, help="Год архива")
+        parser.add_argument('--output', help="Файл для записи (по умолчанию — stdout)")
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"Пользователь '{options['user']}' не найден")
+
+        stream = open(options['output'], 'w', newline='', encoding='utf-8') if options['output'] else self.stdout
+        try:
+            writer = csv.DictWriter(stream, fieldnames=ARCHIVE_COLUMNS)
+            writer.writeheader()
+            aliases = [shard_for_user(user)] if user else shard_aliases()
+            for alias in aliases:
+                with use_shard(alias), read_replica():
+                    for row in iter_archived_usage(user=user, year=options['year']):
+                        writer.writerow(row)
+        finally:
+            if options['output']:
+                stream.close()
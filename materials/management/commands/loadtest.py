@@ -0,0 +1,250 @@
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import numpy as np
+import requests
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from materials.cube import rebuild_cube
+from materials.index import invalidate_material_index
+from materials.models import Category, Material, UsageHistory
+from materials.sharding import use_user_shard
+
+LOADTEST_PREFIX = 'loadtest_'
+LOADTEST_PASSWORD = 'loadtest-password-123'
+
+# Доли сценариев в смеси по умолчанию
+DEFAULT_MIX = 'list=40,list_filtered=20,log=20,history=15,analytics=5'
+
+
+def _parse_mix(raw):
+    mix = {}
+    for part in raw.split(','):
+        name, _, weight = part.partition('=')
+        if name not in SCENARIOS:
+            raise CommandError(f"Неизвестный сценарий '{name}'. Доступны: {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class VirtualUser:
+    """Один клиент: своя сессия allauth и свой набор материалов"""
+
+    def __init__(self, base_url, username, material_ids, category_ids):
+        self.base_url = base_url.rstrip('/')
+        self.username = username
+        self.material_ids = material_ids
+        self.category_ids = category_ids
+        self.session = requests.Session()
+
+    def url(self, path):
+        return f'{self.base_url}{path}'
+
+    def login(self):
+        login_url = self.url('/accounts/login/')
+        self.session.get(login_url)
+        response = self.session.post(login_url, data={
+            'login': self.username,
+            'password': LOADTEST_PASSWORD,
+            'csrfmiddlewaretoken': self.session.cookies.get('csrftoken', ''),
+        }, headers={'Referer': login_url}, allow_redirects=False)
+        if response.status_code != 302:
+            raise CommandError(f"Не удалось войти как {self.username}: HTTP {response.status_code}")
+
+    def list(self):
+        return self.session.get(self.url('/materials/list/'))
+
+    def list_filtered(self):
+        params = random.choice([
+            {'qty_status': random.choice(['low', 'out'])},
+            {'expiry': random.choice(['expired', 'expires_soon', 'no_expiry'])},
+            {'category': random.choice(self.category_ids)} if self.category_ids else {'qty_status': 'low'},
+            {'search': 'Материал 1'},
+        ])
+        return self.session.get(self.url('/materials/list/'), params=params)
+
+    def log(self):
+        material_id = random.choice(self.material_ids)
+        path = self.url(f'/materials/{material_id}/log/')
+        # Приход чаще расхода, чтобы остаток не уходил в ноль за время теста
+        operation_type = random.choice(['IN', 'IN', 'OUT'])
+        return self.session.post(path, data={
+            'quantity': 1,
+            'operation_type': operation_type,
+            'operation_date': date.today().isoformat(),
+            'comment': 'loadtest',
+            'csrfmiddlewaretoken': self.session.cookies.get('csrftoken', ''),
+        }, headers={'Referer': path}, allow_redirects=False)
+
+    def history(self):
+        return self.session.get(self.url(f'/materials/{random.choice(self.material_ids)}/history/'))
+
+    def analytics(self):
+        return self.session.get(self.url('/materials/reports/analytics/'),
+                                params={'days': random.choice([30, 90, 365])})
+
+
+SCENARIOS = {
+    'list': VirtualUser.list,
+    'list_filtered': VirtualUser.list_filtered,
+    'log': VirtualUser.log,
+    'history': VirtualUser.history,
+    'analytics': VirtualUser.analytics,
+}
+
+
+def _percentile(values, q):
+    return float(np.percentile(values, q)) * 1000 if values else None
+
+
+class Command(BaseCommand):
+    help = ("Нагрузочный тест: логин тестовых пользователей через allauth и параллельные запросы "
+            "к основным страницам запущенного сервера; отчет по пропускной способности и задержкам")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000', help="Адрес запущенного сервера")
+        parser.add_argument('--setup', action='store_true',
+                            help="Создать тестовых пользователей и материалы перед запуском")
+        parser.add_argument('--users', type=int, default=10, help="Число тестовых пользователей")
+        parser.add_argument('--materials', type=int, default=200, help="Материалов на пользователя (для --setup)")
+        parser.add_argument('--clients', type=int, default=20, help="Число параллельных клиентов")
+        parser.add_argument('--duration', type=float, default=30, help="Длительность теста, сек")
+        parser.add_argument('--mix', default=DEFAULT_MIX, help=f"Доли сценариев (по умолчанию {DEFAULT_MIX})")
+        parser.add_argument('--output', help="Сохранить результаты в JSON")
+        parser.add_argument('--baseline', help="JSON предыдущего запуска для сравнения")
+
+    def handle(self, *args, **options):
+        mix = _parse_mix(options['mix'])
+        if options['setup']:
+            self._setup(options['users'], options['materials'])
+
+        users = list(User.objects.filter(username__startswith=LOADTEST_PREFIX).order_by('pk')[:options['users']])
+        if not users:
+            raise CommandError("Нет тестовых пользователей. Запустите с --setup")
+
+        clients = []
+        for index in range(options['clients']):
+            user = users[index % len(users)]
+            with use_user_shard(user):
+                material_ids = list(Material.objects.filter(user=user).values_list('pk', flat=True))
+                category_ids = list(Category.objects.filter(user=user).values_list('pk', flat=True))
+            client = VirtualUser(options['base_url'], user.username, material_ids, category_ids)
+            client.login()
+            clients.append(client)
+
+        results = self._run(clients, mix, options['duration'])
+        self._report(results)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(results, output, ensure_ascii=False, indent=2)
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as baseline:
+                self._compare(json.load(baseline), results)
+
+    def _setup(self, users_count, materials_count):
+        today = date.today()
+        for index in range(users_count):
+            username = f'{LOADTEST_PREFIX}{index}'
+            user, created = User.objects.get_or_create(username=username)
+            user.set_password(LOADTEST_PASSWORD)
+            user.save()
+            with use_user_shard(user):
+                if Material.objects.filter(user=user).exists():
+                    continue
+                categories = [Category.objects.create(name=f'{username} категория {number}', user=user)
+                              for number in range(5)]
+                materials = Material.objects.bulk_create([
+                    Material(user=user, name=f'Материал {number}', category=categories[number % 5],
+                             current_quantity=random.randint(0, 100), min_threshold=10,
+                             expiration_date=today + timedelta(days=random.randint(-10, 200))
+                             if number % 3 else None)
+                    for number in range(materials_count)
+                ])
+                UsageHistory.objects.bulk_create([
+                    UsageHistory(material=material, quantity=random.randint(1, 5),
+                                 operation_type=random.choice(['IN', 'OUT', 'OUT', 'DISP']),
+                                 operation_date=today - timedelta(days=random.randint(0, 365)),
+                                 date=today)
+                    for material in materials for _ in range(20)
+                ], batch_size=1000)
+                # bulk_create обходит сигналы, поэтому куб аналитики строится отдельно
+                rebuild_cube(user)
+                invalidate_material_index([user.pk])
+        self.stdout.write(f"Подготовлено тестовых пользователей: {users_count}")
+
+    def _run(self, clients, mix, duration):
+        latencies = defaultdict(list)
+        errors = defaultdict(int)
+        lock = threading.Lock()
+        names = list(mix)
+        weights = list(mix.values())
+        deadline = time.monotonic() + duration
+
+        def worker(client):
+            while time.monotonic() < deadline:
+                name = random.choices(names, weights)[0]
+                started = time.perf_counter()
+                try:
+                    response = SCENARIOS[name](client)
+                    failed = response.status_code >= 400
+                except requests.RequestException:
+                    failed = True
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies[name].append(elapsed)
+                    if failed:
+                        errors[name] += 1
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=len(clients)) as executor:
+            list(executor.map(worker, clients))
+        elapsed = time.monotonic() - started
+
+        endpoints = {}
+        for name in names:
+            values = latencies[name]
+            endpoints[name] = {
+                'requests': len(values),
+                'errors': errors[name],
+                'error_rate': errors[name] / len(values) if values else 0.0,
+                'rps': len(values) / elapsed,
+                'p50_ms': _percentile(values, 50),
+                'p95_ms': _percentile(values, 95),
+                'p99_ms': _percentile(values, 99),
+            }
+        total = sum(item['requests'] for item in endpoints.values())
+        return {
+            'duration': elapsed,
+            'clients': len(clients),
+            'total_requests': total,
+            'total_rps': total / elapsed,
+            'endpoints': endpoints,
+        }
+
+    def _report(self, results):
+        self.stdout.write(f"Клиентов: {results['clients']}, длительность: {results['duration']:.1f} с, "
+                          f"запросов: {results['total_requests']}, всего RPS: {results['total_rps']:.1f}")
+        self.stdout.write(f"{'сценарий':<15}{'запросов':>10}{'RPS':>9}{'p50 мс':>10}{'p95 мс':>10}"
+                          f"{'p99 мс':>10}{'ошибки':>9}")
+        for name, item in results['endpoints'].items():
+            if not item['requests']:
+                continue
+            self.stdout.write(f"{name:<15}{item['requests']:>10}{item['rps']:>9.1f}{item['p50_ms']:>10.1f}"
+                              f"{item['p95_ms']:>10.1f}{item['p99_ms']:>10.1f}{item['error_rate']:>9.1%}")
+
+    def _compare(self, baseline, results):
+        self.stdout.write("Сравнение с базовым запуском (p95, RPS):")
+        for name, item in results['endpoints'].items():
+            old = baseline.get('endpoints', {}).get(name)
+            if not old or not old['p95_ms'] or not item['p95_ms']:
+                continue
+            change = (item['p95_ms'] - old['p95_ms']) / old['p95_ms']
+            line = (f"{name:<15} p95 {old['p95_ms']:.1f} → {item['p95_ms']:.1f} мс ({change:+.0%}), "
+                    f"RPS {old['rps']:.1f} → {item['rps']:.1f}")
+            self.stdout.write(self.style.ERROR(line) if change > 0.2 else line)
@@ -0,0 +1,36 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from materials.models import UserShard
+from materials.sharding import move_user_to_shard, shard_aliases, shard_for_user
+
+
+class Command(BaseCommand):
+    help = "Переносит склад пользователя в другой шард или показывает распределение по шардам"
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', nargs='?', help="Имя пользователя")
+        parser.add_argument('alias', nargs='?', help="Целевая база (например, shard_1)")
+
+    def handle(self, *args, **options):
+        aliases = shard_aliases()
+        if not options['username']:
+            for alias in aliases:
+                users = UserShard.objects.filter(alias=alias).count()
+                self.stdout.write(f"{alias}: {users} пользователей")
+            return
+
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"Пользователь '{options['username']}' не найден")
+
+        target = options['alias']
+        if not target:
+            self.stdout.write(f"{user.username}: {shard_for_user(user)}")
+            return
+        if target not in aliases:
+            raise CommandError(f"Неизвестный шард '{target}'. Доступны: {', '.join(aliases)}")
+
+        moved = move_user_to_shard(user, target)
+        self.stdout.write(self.style.SUCCESS(f"{user.username} → {target}, перенесено записей: {moved}"))
@@ -0,0 +1,17 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from core.profiling import profile_to_disk
+
+
+class Command(BaseCommand):
+    help = "Запускает другую команду под cProfile и сохраняет .prof в каталог профилей"
+
+    def add_arguments(self, parser):
+        parser.add_argument('command_name', help="Имя профилируемой команды")
+        parser.add_argument('command_args', nargs='...', help="Аргументы профилируемой команды")
+
+    def handle(self, *args, **options):
+        name = f"cmd_{options['command_name']}"
+        with profile_to_disk(name):
+            call_command(options['command_name'], *options['command_args'])
@@ -0,0 +1,31 @@
+import io
+import pstats
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.profiling import profiling_dir
+
+
+class Command(BaseCommand):
+    help = "Сводка по сохраненным профилям: самые затратные функции по всем дампам"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--view', help="Учитывать только дампы с этим префиксом имени (view или cmd_<команда>)")
+        parser.add_argument('--top', type=int, default=25, help="Сколько функций показать")
+        parser.add_argument('--sort', default='cumulative', choices=['cumulative', 'tottime', 'ncalls'],
+                            help="Поле сортировки")
+
+    def handle(self, *args, **options):
+        pattern = f"{options['view']}-*.prof" if options['view'] else '*.prof'
+        dumps = sorted(profiling_dir().glob(pattern))
+        if not dumps:
+            raise CommandError(f"Нет профилей в {profiling_dir()} по шаблону {pattern}")
+
+        buffer = io.StringIO()
+        stats = pstats.Stats(str(dumps[0]), stream=buffer)
+        for path in dumps[1:]:
+            stats.add(str(path))
+        stats.strip_dirs().sort_stats(options['sort']).print_stats(options['top'])
+
+        self.stdout.write(f"Профилей учтено: {len(dumps)}")
+        self.stdout.write(buffer.getvalue())
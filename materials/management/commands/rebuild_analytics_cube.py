@@ -0,0 +1,27 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from materials.cube import rebuild_cube
+from materials.sharding import shard_aliases, use_shard, use_user_shard
+
+
+class Command(BaseCommand):
+    help = ("Пересчитывает куб аналитики (категория × неделя/месяц × тип операции) из журнала и архива. "
+            "Нужен после массовой загрузки данных в обход сигналов (bulk_create, импорт)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Пересчитать только склад указанного пользователя (username)")
+
+    def handle(self, *args, **options):
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f"Пользователь '{options['user']}' не найден")
+            with use_user_shard(user):
+                total = rebuild_cube(user)
+        else:
+            total = 0
+            for alias in shard_aliases():
+                with use_shard(alias):
+                    total += rebuild_cube()
+        self.stdout.write(self.style.SUCCESS(f"Ячеек куба: {total}"))
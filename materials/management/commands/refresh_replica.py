@@ -0,0 +1,54 @@
+import os
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from materials.replicas import replica_map, replica_refreshed_key
+
+
+class Command(BaseCommand):
+    help = ("Обновляет реплики для чтения копией основных баз SQLite (online backup API). "
+            "Для локальной проверки; в продакшене реплики обновляет репликация СУБД")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float,
+                            help="Повторять каждые N секунд (без параметра — один раз)")
+
+    def handle(self, *args, **options):
+        replicas = replica_map()
+        if not replicas:
+            raise CommandError("Реплики не настроены (WAREHOUSE_READ_REPLICAS=1)")
+        for primary, replica in replicas.items():
+            for alias in (primary, replica):
+                if settings.DATABASES[alias]['ENGINE'] != 'django.db.backends.sqlite3':
+                    raise CommandError(f"База '{alias}' не SQLite — используйте репликацию СУБД")
+
+        while True:
+            for primary, replica in replicas.items():
+                started = time.time()
+                self._copy(settings.DATABASES[primary]['NAME'], settings.DATABASES[replica]['NAME'])
+                # Записи до начала копирования уже есть в реплике
+                cache.set(replica_refreshed_key(primary), started, None)
+                self.stdout.write(f"{primary} → {replica}: {time.time() - started:.2f} с")
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    @staticmethod
+    def _copy(source_path, target_path):
+        # Копия собирается во временный файл и подменяет реплику атомарно:
+        # открытые соединения дочитывают старую версию, новые видят свежую
+        temporary_path = f'{target_path}.tmp'
+        source = sqlite3.connect(source_path)
+        target = sqlite3.connect(temporary_path)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        os.replace(temporary_path, target_path)
+        connections.close_all()
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.cache import shared_cache_configured
+from materials.dashboard import refresh_dashboard
+
+
+class Command(BaseCommand):
+    help = ("Пересчитывает сводку по всем складам для сотрудников и сохраняет ее в кэш. "
+            "Запускайте по расписанию чаще, чем STAFF_DASHBOARD_CACHE_TIMEOUT")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float,
+                            help="Повторять каждые N секунд (без параметра — один раз)")
+
+    def handle(self, *args, **options):
+        if not shared_cache_configured():
+            raise CommandError("Кэш локален для процесса: сводка не дойдет до сервера. Настройте общий CACHES")
+        while True:
+            started = time.time()
+            dashboard = refresh_dashboard()
+            summary = dashboard['summary']
+            self.stdout.write(self.style.SUCCESS(
+                f"Пользователей: {summary['users']}, складов: {summary['warehouses']}, "
+                f"материалов: {summary['materials']} ({time.time() - started:.2f} с)"
+            ))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,53 @@
+# Generated by Django 6.0 on 2026-10-19 10:57
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materials', '0009_alter_usagehistory_operation_type'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsageArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveIntegerField(verbose_name='Год')),
+                ('part', models.PositiveIntegerField(default=1, verbose_name='Часть')),
+                ('row_count', models.PositiveIntegerField(default=0, verbose_name='Число операций')),
+                ('first_date', models.DateField(verbose_name='Первая операция')),
+                ('last_date', models.DateField(verbose_name='Последняя операция')),
+                ('payload', models.BinaryField(verbose_name='Сжатые данные')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Создан')),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Владелец склада')),
+            ],
+            options={
+                'verbose_name': 'Архив операций',
+                'verbose_name_plural': 'Архивы операций',
+                'ordering': ['user', 'year', 'part'],
+                'constraints': [models.UniqueConstraint(fields=('user', 'year', 'part'), name='unique_archive_user_year_part')],
+            },
+        ),
+        migrations.CreateModel(
+            name='UsageDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('operation_type', models.CharField(choices=[('IN', 'Приход (Закупка)'), ('OUT', 'Расход (Выдача)'), ('DISP', 'Списание (Брак/Просрочка)')], max_length=4, verbose_name='Тип операции')),
+                ('total_quantity', models.FloatField(default=0, verbose_name='Количество за день')),
+                ('operations_count', models.PositiveIntegerField(default=0, verbose_name='Число операций')),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='materials.material', verbose_name='Материал')),
+            ],
+            options={
+                'verbose_name': 'Дневной итог (архив)',
+                'verbose_name_plural': 'Дневные итоги (архив)',
+                'constraints': [models.UniqueConstraint(fields=('material', 'day', 'operation_type'), name='unique_rollup_material_day_type')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-19 11:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materials', '0011_usershard'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usagehistory',
+            index=models.Index(fields=['operation_date'], name='usage_operation_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usagehistory',
+            index=models.Index(fields=['material', 'operation_date'], name='usage_material_date_idx'),
+        ),
+    ]
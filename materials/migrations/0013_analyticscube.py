@@ -0,0 +1,35 @@
+# Generated by Django 6.0 on 2026-10-19 11:13
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materials', '0012_usagehistory_usage_operation_date_idx_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsCube',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('W', 'Неделя'), ('M', 'Месяц')], max_length=1, verbose_name='Период')),
+                ('period_start', models.DateField(verbose_name='Начало периода')),
+                ('operation_type', models.CharField(choices=[('IN', 'Приход (Закупка)'), ('OUT', 'Расход (Выдача)'), ('DISP', 'Списание (Брак/Просрочка)')], max_length=4, verbose_name='Тип операции')),
+                ('total_quantity', models.FloatField(default=0, verbose_name='Количество')),
+                ('operations_count', models.IntegerField(default=0, verbose_name='Число операций')),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='materials.category', verbose_name='Категория')),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Владелец склада')),
+            ],
+            options={
+                'verbose_name': 'Агрегат аналитики',
+                'verbose_name_plural': 'Агрегаты аналитики',
+                'indexes': [models.Index(fields=['user', 'period', 'period_start'], name='cube_user_period_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'category', 'period', 'period_start', 'operation_type'), name='unique_cube_cell')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 6.0 on 2026-10-19 11:40
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materials', '0013_analyticscube'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Lot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('received_on', models.DateField(default=django.utils.timezone.localdate, verbose_name='Дата поступления')),
+                ('expiration_date', models.DateField(blank=True, null=True, verbose_name='Срок годности')),
+                ('initial_quantity', models.FloatField(verbose_name='Поступило')),
+                ('remaining_quantity', models.FloatField(verbose_name='Остаток партии')),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lots', to='materials.material', verbose_name='Материал')),
+                ('operation', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='lots', to='materials.usagehistory', verbose_name='Операция прихода')),
+            ],
+            options={
+                'verbose_name': 'Партия',
+                'verbose_name_plural': 'Партии',
+                'indexes': [models.Index(condition=models.Q(('remaining_quantity__gt', 0)), fields=['material', 'expiration_date', 'received_on'], name='lot_fefo_queue_idx')],
+            },
+        ),
+    ]
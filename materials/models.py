@@ -3,6 +3,7 @@
 from django.db import models
 from django.db.models import TextChoices  # <-- НОВЫЙ ИМПОРТ
 from django.contrib.auth.models import User
+from datetime import date
 from django.utils import timezone
 
 
@@ -18,6 +19,15 @@ class Category(models.Model):
         return self.name
 
 
+def status_row_class(stock, expiry_status):
+    """CSS-класс строки списка по статусам остатка и срока годности"""
+    if stock == 'out' or expiry_status == 'expired':
+        return 'table-danger'
+    if stock == 'low' or expiry_status == 'soon':
+        return 'table-warning'
+    return 'table-light'
+
+
 class Material(models.Model):
     # Константы для единиц измерения
     UNIT_CHOICES = [
@@ -44,6 +54,30 @@ class Material(models.Model):
     def __str__(self):
         return f"{self.name} ({self.article_number})"
 
+    def get_status(self, today=None):
+        """
+        Классификация для списка материалов: остаток ('out'/'low'/'ok'),
+        срок годности ('expired'/'soon'/'ok'/None) и CSS-класс строки.
+        """
+        today = today or date.today()
+        stock = 'ok'
+        if self.current_quantity == 0:
+            stock = 'out'
+        elif 0 < self.current_quantity < self.min_threshold:
+            stock = 'low'
+
+        expiry_status = None
+        if self.expiration_date:
+            days_left = (self.expiration_date - today).days
+            if days_left < 0:
+                expiry_status = 'expired'
+            elif days_left <= 30:
+                expiry_status = 'soon'
+            else:
+                expiry_status = 'ok'
+
+        return {'stock': stock, 'expiry_status': expiry_status, 'row_class': status_row_class(stock, expiry_status)}
+
     class Meta:
         verbose_name = "Материал"
         verbose_name_plural = "Материалы"
@@ -81,7 +115,134 @@ class UsageHistory(models.Model):
         verbose_name = "История операций"
         verbose_name_plural = "История операций"
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['operation_date'], name='usage_operation_date_idx'),
+            models.Index(fields=['material', 'operation_date'], name='usage_material_date_idx'),
+        ]
 
     def __str__(self):
         # Используем get_operation_type_display() для красивого отображения
-        return f"{self.material.name} | {self.get_operation_type_display()} {self.quantity} от {self.date}"
\ No newline at end of file
+        return f"{self.material.name} | {self.get_operation_type_display()} {self.quantity} от {self.date}"
+
+class UsageDailyRollup(models.Model):
+    """
+    Дневные итоги по операциям, перенесенным в архив.
+    Нужны, чтобы отчеты и прогнозы оставались верными после архивации.
+    """
+    material = models.ForeignKey(Material, on_delete=models.CASCADE, verbose_name="Материал")
+    day = models.DateField(verbose_name="День")
+    operation_type = models.CharField(max_length=4, choices=UsageHistory.OperationType.choices,
+                                      verbose_name="Тип операции")
+    total_quantity = models.FloatField(default=0, verbose_name="Количество за день")
+    operations_count = models.PositiveIntegerField(default=0, verbose_name="Число операций")
+
+    class Meta:
+        verbose_name = "Дневной итог (архив)"
+        verbose_name_plural = "Дневные итоги (архив)"
+        constraints = [
+            models.UniqueConstraint(fields=['material', 'day', 'operation_type'],
+                                    name='unique_rollup_material_day_type'),
+        ]
+
+    def __str__(self):
+        return f"{self.material_id} | {self.operation_type} {self.total_quantity} за {self.day}"
+
+
+class UsageArchive(models.Model):
+    """
+    Сжатый архив операций одного пользователя за один год.
+    Данные хранятся по колонкам (JSON + gzip), каждый запуск архивации добавляет новую часть.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, verbose_name="Владелец склада")
+    year = models.PositiveIntegerField(verbose_name="Год")
+    part = models.PositiveIntegerField(default=1, verbose_name="Часть")
+    row_count = models.PositiveIntegerField(default=0, verbose_name="Число операций")
+    first_date = models.DateField(verbose_name="Первая операция")
+    last_date = models.DateField(verbose_name="Последняя операция")
+    payload = models.BinaryField(verbose_name="Сжатые данные")
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="Создан")
+
+    class Meta:
+        verbose_name = "Архив операций"
+        verbose_name_plural = "Архивы операций"
+        ordering = ['user', 'year', 'part']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'year', 'part'], name='unique_archive_user_year_part'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} | {self.year} (часть {self.part}, {self.row_count} оп.)"
+
+
+class UserShard(models.Model):
+    """Карта шардов: в какой базе хранятся данные склада пользователя (хранится в default)"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, verbose_name="Пользователь")
+    alias = models.CharField(max_length=50, verbose_name="База данных")
+
+    class Meta:
+        verbose_name = "Шард пользователя"
+        verbose_name_plural = "Шарды пользователей"
+
+    def __str__(self):
+        return f"{self.user_id} → {self.alias}"
+
+
+class AnalyticsCube(models.Model):
+    """
+    Предагрегированные объемы операций: пользователь × категория × период × тип операции.
+    Поддерживается инкрементально (materials/cube.py), отчеты читают только эту таблицу.
+    """
+
+    class Period(TextChoices):
+        WEEK = 'W', 'Неделя'
+        MONTH = 'M', 'Месяц'
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, verbose_name="Владелец склада")
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True,
+                                 verbose_name="Категория")
+    period = models.CharField(max_length=1, choices=Period.choices, verbose_name="Период")
+    period_start = models.DateField(verbose_name="Начало периода")
+    operation_type = models.CharField(max_length=4, choices=UsageHistory.OperationType.choices,
+                                      verbose_name="Тип операции")
+    total_quantity = models.FloatField(default=0, verbose_name="Количество")
+    operations_count = models.IntegerField(default=0, verbose_name="Число операций")
+
+    class Meta:
+        verbose_name = "Агрегат аналитики"
+        verbose_name_plural = "Агрегаты аналитики"
+        indexes = [
+            models.Index(fields=['user', 'period', 'period_start'], name='cube_user_period_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'category', 'period', 'period_start', 'operation_type'],
+                                    name='unique_cube_cell'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} | {self.category_id} | {self.period}{self.period_start} {self.operation_type}"
+
+
+class Lot(models.Model):
+    """
+    Партия материала: создается приходом, расходуется по FEFO (первым истекает — первым уходит).
+    Сумма остатков партий материала равна его current_quantity (см. materials/lots.py).
+    """
+    material = models.ForeignKey(Material, on_delete=models.CASCADE, related_name='lots', verbose_name="Материал")
+    operation = models.ForeignKey(UsageHistory, on_delete=models.SET_NULL, null=True, blank=True,
+                                  related_name='lots', verbose_name="Операция прихода")
+    received_on = models.DateField(default=timezone.localdate, verbose_name="Дата поступления")
+    expiration_date = models.DateField(null=True, blank=True, verbose_name="Срок годности")
+    initial_quantity = models.FloatField(verbose_name="Поступило")
+    remaining_quantity = models.FloatField(verbose_name="Остаток партии")
+
+    class Meta:
+        verbose_name = "Партия"
+        verbose_name_plural = "Партии"
+        indexes = [
+            # Очередь FEFO: только непустые партии материала в порядке истечения срока
+            models.Index(fields=['material', 'expiration_date', 'received_on'],
+                         condition=models.Q(remaining_quantity__gt=0), name='lot_fefo_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.material_id} | {self.received_on} → {self.expiration_date or '—'}: {self.remaining_quantity}"
@@ -0,0 +1,141 @@
+# materials/replicas.py
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+from .sharding import ShardRouter, shard_for_user
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+_replica_reads = ContextVar('replica_reads', default=False)
+_pinned_to_primary = ContextVar('pinned_to_primary', default=False)
+
+
+def replica_map():
+    """{основная база: реплика} из настройки READ_REPLICAS"""
+    return getattr(settings, 'READ_REPLICAS', {})
+
+
+def primary_for(alias):
+    """Основная база для реплики (для основной базы — она сама)"""
+    for primary, replica in replica_map().items():
+        if replica == alias:
+            return primary
+    return alias
+
+
+@contextmanager
+def read_replica():
+    """
+    Направляет чтение внутри блока на реплики (если они настроены).
+    Работает и как декоратор: @read_replica(). Запись всегда идет в основную базу.
+    """
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+@contextmanager
+def pinned_to_primary(pinned=True):
+    """Запрещает чтение с реплик (read-your-writes после собственной записи)"""
+    token = _pinned_to_primary.set(pinned)
+    try:
+        yield
+    finally:
+        _pinned_to_primary.reset(token)
+
+
+def _write_cache_key(user_id):
+    return f'replica_pin:{user_id}'
+
+
+def replica_refreshed_key(alias):
+    return f'replica_refreshed:{alias}'
+
+
+def mark_user_write(user_id):
+    """Запоминает момент записи пользователя; пока реплика его не догнала, чтение идет с основной базы"""
+    cache.set(_write_cache_key(user_id), time.time(), settings.READ_REPLICA_PIN_SECONDS)
+
+
+def user_needs_primary(user_id, alias='default'):
+    written_at = cache.get(_write_cache_key(user_id))
+    if written_at is None:
+        return False
+    # Если команда refresh_replica отметила обновление позже записи — реплика уже свежая
+    refreshed_at = cache.get(replica_refreshed_key(alias))
+    return refreshed_at is None or refreshed_at <= written_at
+
+
+class ReplicaRouter:
+    """
+    Чтение внутри read_replica() — с реплики базы, выбранной ShardRouter.
+    Ставится в DATABASE_ROUTERS перед ShardRouter.
+    """
+
+    shard_router = ShardRouter()
+
+    def _primary(self, model, **hints):
+        alias = self.shard_router.db_for_read(model, **hints)
+        if alias is None:
+            instance = hints.get('instance')
+            alias = instance._state.db if instance is not None and instance._state.db else 'default'
+        return primary_for(alias)
+
+    def db_for_read(self, model, **hints):
+        if not _replica_reads.get() or _pinned_to_primary.get():
+            return None
+        primary = self._primary(model, **hints)
+        replica = replica_map().get(primary)
+        # Внутри транзакции читаем то, что в ней же записано
+        if replica is None or connections[primary].in_atomic_block:
+            return None
+        return replica
+
+    def db_for_write(self, model, **hints):
+        # Объект, прочитанный с реплики, сохраняется в ее основную базу
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            primary = primary_for(instance._state.db)
+            if primary != instance._state.db:
+                return primary
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if primary_for(obj1._state.db) == primary_for(obj2._state.db):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Реплика — копия основной базы, схема приходит вместе с данными
+        if primary_for(db) != db:
+            return False
+        return None
+
+
+class ReplicaMiddleware:
+    """
+    Закрепляет чтение за основной базой для пользователя, который недавно сам писал,
+    и отмечает момент записи после небезопасных запросов (POST и т.п.)
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated or not replica_map():
+            return self.get_response(request)
+
+        with pinned_to_primary(user_needs_primary(user.pk, shard_for_user(user))):
+            response = self.get_response(request)
+        if request.method not in SAFE_METHODS:
+            mark_user_write(user.pk)
+        return response
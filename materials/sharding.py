@@ -0,0 +1,260 @@
+# materials/sharding.py
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponseRedirect
+from django.urls import reverse
+
+# Модели, данные которых разносятся по шардам вместе с владельцем склада
+SHARDED_MODELS = {
+    'materials.category',
+    'materials.material',
+    'materials.usagehistory',
+    'materials.lot',
+    'materials.usagedailyrollup',
+    'materials.usagearchive',
+    'materials.analyticscube',
+    'forecasting.usagetrendstats',
+    'forecasting.stockanomaly',
+    'forecasting.ledgercheckpoint',
+}
+
+SHARD_CACHE_TIMEOUT = 300
+
+# Выбор шарда в админке
+ADMIN_SHARD_PARAM = '_shard'
+ADMIN_SHARD_SESSION_KEY = 'admin_shard'
+
+_current_shard = ContextVar('warehouse_shard', default=None)
+
+
+def shard_aliases():
+    return list(getattr(settings, 'WAREHOUSE_SHARDS', ['default']))
+
+
+def current_shard():
+    """Шард, выбранный для текущего запроса или команды (по умолчанию — default)"""
+    return _current_shard.get() or 'default'
+
+
+@contextmanager
+def use_shard(alias):
+    """Направляет запросы к шардированным моделям в указанную базу"""
+    token = _current_shard.set(alias)
+    try:
+        yield alias
+    finally:
+        _current_shard.reset(token)
+
+
+def shard_atomic(**kwargs):
+    """
+    transaction.atomic на базе текущего шарда. Без using блок открывается только на default,
+    а записи в другой шард внутри него фиксируются каждая по отдельности.
+    """
+    return transaction.atomic(using=current_shard(), **kwargs)
+
+
+def on_shard_commit(func):
+    """transaction.on_commit для транзакции текущего шарда"""
+    transaction.on_commit(func, using=current_shard())
+
+
+def _shard_cache_key(user_id):
+    return f'warehouse_shard:{user_id}'
+
+
+def shard_for_user(user):
+    """
+    Возвращает шард пользователя. При первом обращении пользователь закрепляется
+    за шардом по остатку от деления id, назначение сохраняется в UserShard.
+    """
+    aliases = shard_aliases()
+    if len(aliases) == 1:
+        return aliases[0]
+
+    user_id = user.pk
+    alias = cache.get(_shard_cache_key(user_id))
+    if alias in aliases:
+        return alias
+
+    from .models import UserShard
+    assignment = UserShard.objects.filter(user_id=user_id).first()
+    if assignment is None:
+        alias = aliases[user_id % len(aliases)]
+        ensure_user_on_shard(user, alias)
+        assignment, _ = UserShard.objects.get_or_create(user_id=user_id, defaults={'alias': alias})
+    cache.set(_shard_cache_key(user_id), assignment.alias, SHARD_CACHE_TIMEOUT)
+    return assignment.alias
+
+
+@contextmanager
+def use_user_shard(user):
+    with use_shard(shard_for_user(user)) as alias:
+        yield alias
+
+
+def ensure_user_on_shard(user, alias):
+    """
+    Копирует строку пользователя в базу шарда, чтобы внешние ключи на auth_user
+    внутри шарда оставались целостными. Источник истины — база default.
+    """
+    if alias == 'default':
+        return
+    values = {field.attname: getattr(user, field.attname) for field in User._meta.concrete_fields}
+    User.objects.using(alias).update_or_create(pk=user.pk, defaults=values)
+
+
+def _copy_rows(model, rows, target, remap):
+    """Создает копии строк в целевой базе с новыми id и возвращает соответствие старых id новым"""
+    fk_fields = {
+        field.attname: field.related_model._meta.label_lower
+        for field in model._meta.concrete_fields
+        if field.is_relation and field.related_model._meta.label_lower in remap
+    }
+    copies = []
+    old_ids = []
+    for row in rows:
+        values = {field.attname: getattr(row, field.attname)
+                  for field in model._meta.concrete_fields if not field.primary_key}
+        for attname, related_label in fk_fields.items():
+            if values[attname] is not None:
+                values[attname] = remap[related_label][values[attname]]
+        copies.append(model(**values))
+        old_ids.append(row.pk)
+    created = model.objects.using(target).bulk_create(copies, batch_size=500)
+    return dict(zip(old_ids, (obj.pk for obj in created)))
+
+
+def move_user_to_shard(user, target):
+    """
+    Переносит все данные склада пользователя в другой шард и обновляет карту шардов.
+    Во время переноса пользователь не должен выполнять операции.
+    """
+    from .models import (
+        AnalyticsCube, Category, Lot, Material, UsageHistory, UsageDailyRollup, UsageArchive, UserShard,
+    )
+    from forecasting.models import LedgerCheckpoint, StockAnomaly, UsageTrendStats
+
+    source = shard_for_user(user)
+    if source == target:
+        return 0
+
+    ensure_user_on_shard(user, target)
+    plan = [
+        (Category, {'user': user}),
+        (Material, {'user': user}),
+        (UsageHistory, {'material__user': user}),
+        (Lot, {'material__user': user}),
+        (UsageDailyRollup, {'material__user': user}),
+        (UsageArchive, {'user': user}),
+        (AnalyticsCube, {'user': user}),
+        # Состояние прогнозирования: без него после переноса теряется история аномалий,
+        # а сверка с журналом начинается заново и пропускает первую ручную корректировку
+        (UsageTrendStats, {'material__user': user}),
+        (StockAnomaly, {'material__user': user}),
+        (LedgerCheckpoint, {'material__user': user}),
+    ]
+    remap = {}
+    moved = 0
+    with transaction.atomic(using=target):
+        for model, lookup in plan:
+            rows = model.objects.using(source).filter(**lookup).order_by('pk')
+            remap[model._meta.label_lower] = _copy_rows(model, rows, target, remap)
+            moved += len(remap[model._meta.label_lower])
+
+    from .signals import ledger_signals_muted
+    # Учет не меняется, куб аналитики перенесен вместе с данными — обработчики не нужны
+    with transaction.atomic(using=source), ledger_signals_muted():
+        # История, партии, дневные итоги и данные прогнозирования удаляются каскадно вместе с материалами
+        Material.objects.using(source).filter(user=user).delete()
+        Category.objects.using(source).filter(user=user).delete()
+        UsageArchive.objects.using(source).filter(user=user).delete()
+        AnalyticsCube.objects.using(source).filter(user=user).delete()
+
+    UserShard.objects.update_or_create(user=user, defaults={'alias': target})
+    cache.set(_shard_cache_key(user.pk), target, SHARD_CACHE_TIMEOUT)
+    # Копии материалов в новом шарде получили другие id
+    from .index import invalidate_material_index
+    invalidate_material_index([user.pk])
+    return moved
+
+
+def delete_user_from_shards(user):
+    """Удаляет копии пользователя (и каскадно его склад) из всех шардов, кроме default"""
+    for alias in shard_aliases():
+        if alias != 'default':
+            User.objects.using(alias).filter(pk=user.pk).delete()
+    cache.delete(_shard_cache_key(user.pk))
+
+
+class ShardRouter:
+    """Направляет запросы к данным склада в шард его владельца"""
+
+    def db_for_read(self, model, **hints):
+        return self._db_for_model(model, **hints)
+
+    def db_for_write(self, model, **hints):
+        return self._db_for_model(model, **hints)
+
+    def _db_for_model(self, model, **hints):
+        label = model._meta.label_lower
+        if label == 'materials.usershard':
+            return 'default'
+        if label not in SHARDED_MODELS:
+            return None
+        instance = hints.get('instance')
+        if (instance is not None and instance._state.db
+                and instance._meta.label_lower in SHARDED_MODELS):
+            return instance._state.db
+        return current_shard()
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Пользователь продублирован во всех шардах, связь с ним допустима из любой базы
+        if isinstance(obj1, User) or isinstance(obj2, User):
+            return True
+        return None
+
+
+class ShardMiddleware:
+    """
+    Выбирает шард по текущему пользователю на время обработки запроса.
+    Админка работает не со складом сотрудника, а с шардом, выбранным явно
+    (параметр ?_shard=<alias>, запоминается в сессии; по умолчанию — первый шард).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated:
+            return self.get_response(request)
+        if user.is_staff and request.path_info.startswith(reverse('admin:index')):
+            return self._admin_request(request)
+        with use_user_shard(user):
+            return self.get_response(request)
+
+    def _admin_request(self, request):
+        aliases = shard_aliases()
+        selected = request.GET.get(ADMIN_SHARD_PARAM)
+        if selected is not None:
+            if selected in aliases:
+                request.session[ADMIN_SHARD_SESSION_KEY] = selected
+            # Параметр убирается из адреса: список объектов в админке принял бы его за фильтр
+            query = request.GET.copy()
+            del query[ADMIN_SHARD_PARAM]
+            return HttpResponseRedirect(f'{request.path}?{query.urlencode()}' if query else request.path)
+
+        alias = request.session.get(ADMIN_SHARD_SESSION_KEY)
+        if alias not in aliases:
+            alias = aliases[0]
+        request.admin_shard = alias
+        request.admin_shards = aliases if len(aliases) > 1 else []
+        with use_shard(alias):
+            return self.get_response(request)
@@ -0,0 +1,142 @@
+# materials/signals.py
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import pre_delete, pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from core.auth import invalidate_cached_user
+from .cube import apply_usage_to_cube, merge_category_into_uncategorized, move_material_in_cube, \
+    remove_material_from_cube
+from .index import invalidate_material_index, material_row, registry
+from .models import Category, Material, UsageHistory
+from .sharding import delete_user_from_shards
+
+_ledger_signals_muted = ContextVar('ledger_signals_muted', default=False)
+# Материалы, удаляемые прямо сейчас: их вклад в куб уже вычтен целиком
+_materials_being_deleted = ContextVar('materials_being_deleted', default=frozenset())
+
+
+@contextmanager
+def ledger_signals_muted():
+    """
+    Отключает обработчики изменений журнала операций (статистики, агрегаты).
+    Нужно, когда строки переносятся без изменения учета — например, при архивации.
+    """
+    token = _ledger_signals_muted.set(True)
+    try:
+        yield
+    finally:
+        _ledger_signals_muted.reset(token)
+
+
+def ledger_signals_active():
+    return not _ledger_signals_muted.get()
+
+
+@receiver(pre_delete, sender=User)
+def remove_user_shard_data(sender, instance, using, **kwargs):
+    # Удаление идет из основной базы; копии в шардах удаляем вместе с их складом
+    if using == 'default':
+        delete_user_from_shards(instance)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_cache(sender, instance, **kwargs):
+    # Пароль, активность и права должны примениться к следующему запросу
+    invalidate_cached_user(instance.pk)
+
+
+# --- Куб аналитики (materials/cube.py) ---
+
+def usage_contribution(history):
+    """Вклад операции в куб и статистику тренда: (материал, тип, дата, количество)"""
+    return history.material_id, history.operation_type, history.operation_date, history.quantity
+
+
+@receiver(pre_save, sender=UsageHistory)
+def remember_previous_usage(sender, instance, **kwargs):
+    # При редактировании операции ее прежний вклад убирается из куба и статистики тренда
+    # (forecasting/signals.py); прежняя строка читается один раз для обоих обработчиков
+    instance._previous_usage = None
+    if instance.pk and ledger_signals_active():
+        instance._previous_usage = UsageHistory.objects.filter(pk=instance.pk).values_list(
+            'material_id', 'operation_type', 'operation_date', 'quantity',
+        ).first()
+
+
+@receiver(post_save, sender=UsageHistory)
+def update_cube_on_usage_save(sender, instance, **kwargs):
+    if not ledger_signals_active():
+        return
+    previous = getattr(instance, '_previous_usage', None)
+    if previous:
+        apply_usage_to_cube(*previous, sign=-1)
+    apply_usage_to_cube(*usage_contribution(instance))
+
+
+@receiver(post_delete, sender=UsageHistory)
+def update_cube_on_usage_delete(sender, instance, **kwargs):
+    if ledger_signals_active() and instance.material_id not in _materials_being_deleted.get():
+        apply_usage_to_cube(*usage_contribution(instance), sign=-1)
+
+
+@receiver(pre_save, sender=Material)
+def remember_previous_category(sender, instance, **kwargs):
+    instance._previous_category_id = None
+    if instance.pk and ledger_signals_active():
+        instance._previous_category_id = (
+            Material.objects.filter(pk=instance.pk).values_list('category_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Material)
+def move_material_on_category_change(sender, instance, created, **kwargs):
+    if created or not ledger_signals_active():
+        return
+    previous = getattr(instance, '_previous_category_id', None)
+    if previous != instance.category_id:
+        move_material_in_cube(instance.pk, previous, instance.category_id)
+
+
+@receiver(pre_delete, sender=Material)
+def remove_deleted_material_from_cube(sender, instance, **kwargs):
+    if ledger_signals_active():
+        remove_material_from_cube(instance.pk)
+        _materials_being_deleted.set(_materials_being_deleted.get() | {instance.pk})
+
+
+@receiver(post_delete, sender=Material)
+def forget_deleted_material(sender, instance, **kwargs):
+    _materials_being_deleted.set(_materials_being_deleted.get() - {instance.pk})
+
+
+@receiver(pre_delete, sender=Category)
+def merge_deleted_category_cube(sender, instance, **kwargs):
+    if ledger_signals_active():
+        merge_category_into_uncategorized(instance)
+
+
+# --- Индекс материалов в памяти (materials/index.py) ---
+
+@receiver(post_save, sender=Material)
+def update_material_index_on_save(sender, instance, using, **kwargs):
+    # Применяем после коммита (в базе, куда шла запись): откат транзакции не должен попасть в индекс
+    row = material_row(instance)
+    transaction.on_commit(lambda: registry.apply(instance.user_id, instance.pk, row), using=using)
+
+
+@receiver(post_delete, sender=Material)
+def update_material_index_on_delete(sender, instance, using, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: registry.apply(instance.user_id, pk, None), using=using)
+
+
+@receiver(post_delete, sender=Category)
+def invalidate_material_index_on_category_delete(sender, instance, using, **kwargs):
+    # Материалы теряют категорию через UPDATE без сигналов
+    transaction.on_commit(lambda: invalidate_material_index([instance.user_id]), using=using)
@@ -1,3 +1,223 @@
-from django.test import TestCase
+import tempfile
+from datetime import date
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from core.auth import CachedModelBackend, invalidate_cached_user
+from forecasting.model_utils import rebuild_trend_stats
+from forecasting.models import StockAnomaly, UsageTrendStats
+from .archive import archive_usage_before
+from .index import material_row, registry
+from .lots import reconcile_lots
+from .models import AnalyticsCube, Category, Lot, Material, UsageArchive, UsageDailyRollup, UsageHistory, UserShard
+from .sharding import ensure_user_on_shard, move_user_to_shard, shard_aliases, use_shard, use_user_shard
+
+
+class QueryBudgetTests(TestCase):
+    """Страницы склада не делают запросов к базе до представления сверх бюджета"""
+
+    # Шарды, но не реплики: реплика в тестах — зеркало своей базы
+    databases = set(shard_aliases())
+
+    def setUp(self):
+        cache_dir = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(
+            CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': cache_dir,
+            }},
+            QUERY_BUDGET_BEFORE_VIEW=1,
+            QUERY_BUDGET_STRICT=True,
+        ))
+        self.user = User.objects.create_user('budget', password='secret-password-1')
+        # Назначение шарда (и его кэширование) — здесь, а не в первом запросе
+        with use_user_shard(self.user):
+            category = Category.objects.create(name='Расходники', user=self.user)
+            self.material = Material.objects.create(user=self.user, name='Перчатки', category=category,
+                                                    article_number='BUDGET-1', current_quantity=5)
+        self.client.force_login(self.user)
+
+    def test_material_list_within_budget(self):
+        for _ in range(2):
+            self.assertEqual(self.client.get('/materials/list/').status_code, 200)
+
+    def test_log_operation_form_within_budget(self):
+        for _ in range(2):
+            response = self.client.get(f'/materials/{self.material.pk}/log/')
+            self.assertEqual(response.status_code, 200)
+
+    def test_budget_exceeded_fails_in_strict_mode(self):
+        invalidate_cached_user(self.user.pk)
+        with override_settings(QUERY_BUDGET_BEFORE_VIEW=0):
+            with self.assertRaises(AssertionError):
+                self.client.get('/materials/list/')
+
+
+class CachedBackendTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('cached', password='secret-password-1')
+
+    def test_process_local_cache_is_not_used(self):
+        backend = CachedModelBackend()
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            backend.get_user(self.user.pk)
+            with self.assertNumQueries(1):
+                backend.get_user(self.user.pk)
+
+
+@override_settings(MATERIAL_INDEX_VERIFY_RATE=0)
+class MaterialIndexRegistryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('indexed', password='secret-password-1')
+        self.material = Material.objects.create(user=self.user, name='Маска', article_number='INDEX-1',
+                                                current_quantity=3)
+        registry.invalidate(self.user.pk)
+        registry.get(self.user.pk)
+
+    def _apply_change(self):
+        self.material.current_quantity = 7
+        registry.apply(self.user.pk, self.material.pk, material_row(self.material))
+
+    def test_delta_applied_with_atomic_incr(self):
+        with mock.patch('materials.index.atomic_incr_configured', return_value=True):
+            self._apply_change()
+        self.assertIn(self.user.pk, registry._indexes)
+        self.assertEqual(list(registry.get(self.user.pk).quantity), [7])
+
+    def test_index_dropped_without_atomic_incr(self):
+        # Неатомарный incr файлового кэша: дельта не применяется, индекс перестраивается из базы
+        self._apply_change()
+        self.assertNotIn(self.user.pk, registry._indexes)
+
+
+class UsageEditSignalTests(TestCase):
+    def test_previous_usage_read_once_for_cube_and_trend(self):
+        user = User.objects.create_user('editor', password='secret-password-1')
+        material = Material.objects.create(user=user, name='Шприц', article_number='EDIT-1')
+        history = UsageHistory.objects.create(material=material, quantity=2,
+                                              operation_type=UsageHistory.OperationType.OUT)
+        rebuild_trend_stats([material.pk])
+        history.quantity = 5
+        with CaptureQueriesContext(connection) as queries:
+            history.save()
+        previous_reads = [
+            query for query in queries.captured_queries
+            if query['sql'].startswith('SELECT') and 'FROM "materials_usagehistory"' in query['sql']
+        ]
+        self.assertEqual(len(previous_reads), 1)
+        cube = AnalyticsCube.objects.filter(user=user, period=AnalyticsCube.Period.MONTH,
+                                            operation_type=UsageHistory.OperationType.OUT)
+        self.assertEqual(cube.aggregate(total=Sum('total_quantity'))['total'], 5)
+        self.assertEqual(UsageTrendStats.objects.get(material=material).sum_y, 5)
+
+
+def create_user_on_shard(username, alias):
+    """Пользователь, закрепленный за указанным шардом (а не по остатку от деления id)"""
+    user = User.objects.create_user(username, password='secret-password-1')
+    ensure_user_on_shard(user, alias)
+    UserShard.objects.create(user=user, alias=alias)
+    cache.delete(f'warehouse_shard:{user.pk}')
+    return user
+
+
+@skipUnless(len(shard_aliases()) > 1, "нужно несколько шардов: WAREHOUSE_SHARDS=2")
+class ShardedWarehouseTests(TestCase):
+    """Склад пользователя в шарде, отличном от default (несколько файлов SQLite)"""
+
+    databases = set(shard_aliases())
+
+    def setUp(self):
+        self.shard = shard_aliases()[1]
+        self.user = create_user_on_shard('sharded', self.shard)
+        with use_shard(self.shard):
+            self.material = Material.objects.create(user=self.user, name='Бинт', article_number='SHARD-1',
+                                                    current_quantity=10)
+            reconcile_lots(self.material)
+        self.client.force_login(self.user)
+
+    def _post_operation(self, operation_type, quantity):
+        return self.client.post(f'/materials/{self.material.pk}/log/', {
+            'quantity': quantity, 'operation_type': operation_type, 'comment': '',
+            'operation_date': '2026-01-15',
+        })
+
+    def _state(self):
+        with use_shard(self.shard):
+            quantity = Material.objects.get(pk=self.material.pk).current_quantity
+            in_lots = Lot.objects.filter(material_id=self.material.pk).aggregate(total=Sum('remaining_quantity'))
+            operations = UsageHistory.objects.filter(material_id=self.material.pk).count()
+        return quantity, in_lots['total'], operations
+
+    def test_log_operation_keeps_lots_in_sync(self):
+        self.assertEqual(self._post_operation(UsageHistory.OperationType.OUT, 4).status_code, 302)
+        self.assertEqual(self._state(), (6, 6, 1))
+
+    def test_log_operation_failure_rolls_back_on_shard(self):
+        with mock.patch('materials.views.refresh_expiration_date', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self._post_operation(UsageHistory.OperationType.OUT, 4)
+        # Списание с партий и запись журнала откатились вместе с остатком
+        self.assertEqual(self._state(), (10, 10, 0))
+
+    def _add_history(self, *dates):
+        with use_shard(self.shard):
+            for operation_date in map(date.fromisoformat, dates):
+                UsageHistory.objects.create(material=self.material, quantity=1, operation_date=operation_date,
+                                            date=operation_date, operation_type=UsageHistory.OperationType.OUT)
+
+    def test_archive_on_shard(self):
+        self._add_history('2024-03-01', '2024-03-01', '2024-05-10', '2026-01-10')
+        with use_shard(self.shard):
+            report = archive_usage_before(date(2025, 1, 1))
+            self.assertEqual(report, [(self.user.pk, 2024, 3)])
+            self.assertEqual(UsageHistory.objects.filter(material=self.material).count(), 1)
+            self.assertEqual(UsageArchive.objects.get(user=self.user).row_count, 3)
+            rollups = UsageDailyRollup.objects.filter(material=self.material)
+            self.assertEqual(rollups.aggregate(total=Sum('operations_count'))['total'], 3)
+
+    def test_archive_failure_rolls_back_on_shard(self):
+        self._add_history('2024-03-01', '2024-05-10')
+        with mock.patch('materials.archive._merge_rollups', side_effect=RuntimeError):
+            with use_shard(self.shard), self.assertRaises(RuntimeError):
+                archive_usage_before(date(2025, 1, 1))
+        with use_shard(self.shard):
+            # Операции не должны оказаться одновременно в журнале и в архиве
+            self.assertFalse(UsageArchive.objects.filter(user=self.user).exists())
+            self.assertEqual(UsageHistory.objects.filter(material=self.material).count(), 2)
+
+    def test_move_user_to_shard(self):
+        self._add_history('2026-01-10')
+        with use_shard(self.shard):
+            StockAnomaly.objects.create(material=self.material, kind=StockAnomaly.Kind.SPIKE, score=5)
+        target = 'default'
+        moved = move_user_to_shard(self.user, target)
+        self.assertGreater(moved, 0)
+        self.assertEqual(UserShard.objects.get(user=self.user).alias, target)
+        with use_shard(self.shard):
+            self.assertFalse(Material.objects.filter(user=self.user).exists())
+        with use_shard(target):
+            material = Material.objects.get(user=self.user)
+            self.assertEqual(UsageHistory.objects.filter(material=material).count(), 1)
+            self.assertEqual(StockAnomaly.objects.filter(material=material).count(), 1)
+            in_lots = Lot.objects.filter(material=material).aggregate(total=Sum('remaining_quantity'))['total']
+            self.assertEqual(in_lots, material.current_quantity)
+
+    def test_admin_uses_selected_shard(self):
+        admin = create_user_on_shard('admin', 'default')
+        admin.is_staff = admin.is_superuser = True
+        admin.save()
+        self.client.force_login(admin)
+        changelist = '/admin/materials/material/'
+        self.assertEqual(self.client.get(changelist).context['cl'].result_count, 0)
+
+        response = self.client.get(f'{changelist}?_shard={self.shard}&q=Бинт')
+        self.assertRedirects(response, f'{changelist}?q=%D0%91%D0%B8%D0%BD%D1%82', fetch_redirect_response=False)
+        response = self.client.get(f'{changelist}?q=Бинт')
+        self.assertEqual([material.pk for material in response.context['cl'].result_list], [self.material.pk])
+        self.assertContains(response, f'<strong>{self.shard}</strong>', html=True)
@@ -13,8 +13,14 @@ urlpatterns = [
     # Операции и История
     path('<int:pk>/log/', views.log_operation, name='log_operation'),
     path('<int:pk>/history/', views.material_history, name='material_history'),
+    path('events/', views.stock_events, name='stock_events'),
 
     # Отчеты и Аналитика
     path('reports/analytics/', views.analytics_report, name='analytics_report'),
+    path('reports/categories/', views.category_report, name='category_report'),
     path('forecast/<int:pk>/', views.material_forecast, name='material_forecast'),
+    path('reports/purchase-plan/', views.purchase_plan, name='purchase_plan'),
+    path('forecast/metrics/', views.forecast_metrics, name='forecast_metrics'),
+    path('staff/dashboard/', views.staff_dashboard, name='staff_dashboard'),
+    path('safety-stock/', views.safety_stock, name='safety_stock'),
 ]
\ No newline at end of file
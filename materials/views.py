@@ -1,13 +1,29 @@
 # materials/views.py
 
+import csv
+
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
+from django.core.paginator import Paginator
 from django.contrib.auth.decorators import login_required
-from django.db.models import Sum, Q, F
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db.models import Sum
 from datetime import date, timedelta
-from .models import Material, Category, UsageHistory
+from .models import Material, Category, UsageHistory, AnalyticsCube, status_row_class
 from .forms import MaterialForm, UsageHistoryForm
+from .archive import rollup_totals
+from .cube import cube_report, period_end, period_start
+from .lots import consume_fefo, fefo_queue, receive_lot, reconcile_lots, refresh_expiration_date
+from .replicas import read_replica
+from .sharding import on_shard_commit, shard_atomic
+from .index import EXPIRY_NAMES, STOCK_NAMES, get_material_index
+from .dashboard import SORT_FIELDS, get_dashboard, refresh_dashboard
+from .events import get_broker, live_updates_available, publish_stock_change, stock_channel
 from django.utils import timezone
-from forecasting.model_utils import get_recommendation
+from forecasting.model_utils import get_recommendation, get_purchase_plan
+from forecasting.admission import forecast_admission, forecast_horizon, get_forecast_limiter
+from forecasting.anomalies import recent_anomalies
+from forecasting.safety_stock import recalculate_thresholds, safety_stock_settings
 
 
 # --- Основные операции ---
@@ -19,7 +35,11 @@ def material_create(request):
         if form.is_valid():
             material = form.save(commit=False)
             material.user = request.user
-            material.save()
+            with shard_atomic():
+                material.save()
+                # Начальный остаток становится первой партией
+                reconcile_lots(material)
+            on_shard_commit(lambda: publish_stock_change(material))
             return redirect('material_list')
     else:
         form = MaterialForm()
@@ -32,7 +52,13 @@ def material_update(request, pk):
     if request.method == 'POST':
         form = MaterialForm(request.POST, instance=material)
         if form.is_valid():
-            form.save()
+            with shard_atomic():
+                form.save()
+                # Ручная правка остатка: излишек — новая партия, недостача — списание по FEFO
+                reconcile_lots(material)
+                if refresh_expiration_date(material):
+                    material.save(update_fields=['expiration_date'])
+            on_shard_commit(lambda: publish_stock_change(material))
             return redirect('material_list')
     else:
         form = MaterialForm(instance=material)
@@ -43,7 +69,9 @@ def material_update(request, pk):
 def material_delete(request, pk):
     material = get_object_or_404(Material, pk=pk, user=request.user)
     if request.method == 'POST':
+        deleted = Material(pk=material.pk, user_id=material.user_id)
         material.delete()
+        on_shard_commit(lambda: publish_stock_change(deleted, deleted=True))
         return redirect('material_list')
     return render(request, 'materials/material_confirm_delete.html', {'material': material})
 
@@ -58,23 +86,35 @@ def log_operation(request, pk):
             quantity = form.cleaned_data['quantity']
             operation_type = form.cleaned_data['operation_type']
 
-            # Логика обновления остатка материала
-            if operation_type == UsageHistory.OperationType.IN:
-                material.current_quantity += quantity
-            elif operation_type in [UsageHistory.OperationType.OUT, UsageHistory.OperationType.DISP]:
-                # Проверка на отрицательный остаток
-                if material.current_quantity < quantity:
-                    form.add_error('quantity', f"Недостаточно запаса. Доступно: {material.current_quantity}")
-                    return render(request, 'materials/log_operation_form.html', {'form': form, 'material': material})
-
-                material.current_quantity -= quantity
-
-            material.save()
-
-            # Сохранение истории
-            history = form.save(commit=False)
-            history.material = material
-            history.save()
+            with shard_atomic():
+                material = Material.objects.select_for_update().get(pk=material.pk)
+                # Остаток мог измениться в обход партий (склад до их появления, правка в админке)
+                reconcile_lots(material)
+
+                # Логика обновления остатка материала
+                if operation_type == UsageHistory.OperationType.IN:
+                    material.current_quantity += quantity
+                elif operation_type in [UsageHistory.OperationType.OUT, UsageHistory.OperationType.DISP]:
+                    # Проверка на отрицательный остаток
+                    if material.current_quantity < quantity:
+                        form.add_error('quantity', f"Недостаточно запаса. Доступно: {material.current_quantity}")
+                        return render(request, 'materials/log_operation_form.html',
+                                      {'form': form, 'material': material})
+
+                    material.current_quantity -= quantity
+                    consume_fefo(material, quantity)
+
+                # Сохранение истории
+                history = form.save(commit=False)
+                history.material = material
+                history.save()
+
+                if operation_type == UsageHistory.OperationType.IN:
+                    receive_lot(material, quantity, received_on=history.operation_date,
+                                expiration_date=form.cleaned_data.get('lot_expiration_date'), operation=history)
+                refresh_expiration_date(material)
+                material.save()
+            on_shard_commit(lambda: publish_stock_change(material))
 
             return redirect('material_list')
     else:
@@ -87,7 +127,34 @@ def log_operation(request, pk):
 def material_history(request, pk):
     material = get_object_or_404(Material, pk=pk, user=request.user)
     history = UsageHistory.objects.filter(material=material).order_by('-operation_date', '-id')
-    return render(request, 'materials/material_history.html', {'material': material, 'history': history})
+    lots = fefo_queue(material)
+    return render(request, 'materials/material_history.html',
+                  {'material': material, 'history': history, 'lots': lots, 'today': date.today()})
+
+
+@login_required
+async def stock_events(request):
+    """
+    Поток server-sent events с изменениями остатков склада пользователя.
+    Работает под ASGI (core/asgi.py): соединение держится открытым и не занимает поток.
+    Под WSGI отвечает 204 — по этому коду EventSource прекращает переподключения.
+    """
+    if not live_updates_available(request):
+        return HttpResponse(status=204)
+    user = await request.auser()
+
+    async def event_stream():
+        yield 'retry: 5000\n\n'
+        async for message in get_broker().subscribe(stock_channel(user.pk)):
+            if message is None:
+                yield ': keep-alive\n\n'
+            else:
+                yield f'event: stock\ndata: {message}\n\n'
+
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 
 # --- Список и Анализ ---
@@ -96,7 +163,6 @@ def material_history(request, pk):
 def material_list(request):
     """Список материалов с фильтрацией и цветовой маркировкой"""
     user = request.user
-    queryset = Material.objects.filter(user=user)
     categories = Category.objects.filter(user=user).order_by('name')
 
     # Фильтры
@@ -106,63 +172,38 @@ def material_list(request):
     qty_filter = request.GET.get('qty_status')
     today = date.today()
 
-    if search_query:
-        queryset = queryset.filter(
-            Q(name__icontains=search_query) | Q(article_number__icontains=search_query)
-        )
-    if category_id:
-        queryset = queryset.filter(category_id=category_id)
-
-    if qty_filter == 'low':
-        queryset = queryset.filter(current_quantity__lt=F('min_threshold'), current_quantity__gt=0)
-    elif qty_filter == 'out':
-        queryset = queryset.filter(current_quantity=0)
-
-    if expiry_filter == 'expired':
-        queryset = queryset.filter(expiration_date__lt=today)
-    elif expiry_filter == 'expires_soon':
-        future_date = today + timedelta(days=30)
-        queryset = queryset.filter(expiration_date__range=[today, future_date])
-    elif expiry_filter == 'no_expiry':
-        queryset = queryset.filter(expiration_date__isnull=True)
-
-    materials = queryset.order_by('name')
-
-    total_count = materials.count()
-    critical_count = 0
-    below_threshold_count = 0
-    soon_expiry_count = 0
-
-    for material in materials:
-        is_critical = False
-        is_warning = False
-
-        if material.current_quantity == 0:
-            is_critical = True
-
-        if material.expiration_date:
-            days_left = (material.expiration_date - today).days
-            if days_left < 0:
-                is_critical = True
-                material.expiry_status = 'expired'
-            elif days_left <= 30:
-                soon_expiry_count += 1
-                is_warning = True
-                material.expiry_status = 'soon'
-            else:
-                material.expiry_status = 'ok'
-
-        if material.current_quantity < material.min_threshold and material.current_quantity > 0:
-            below_threshold_count += 1
-            is_warning = True
-
-        if is_critical:
-            material.row_class = 'table-danger'
-            critical_count += 1
-        elif is_warning:
-            material.row_class = 'table-warning'
-        else:
-            material.row_class = 'table-light'
+    # Фильтрация, классификация и счетчики — по индексу в памяти (materials/index.py),
+    # из базы читаются только строки, попавшие в выборку
+    index = get_material_index(user)
+    ids, stock, expiry_status, counts = index.query(
+        today,
+        category_id=int(category_id) if category_id and category_id.isdigit() else None,
+        qty_status=qty_filter,
+        expiry=expiry_filter,
+        search=search_query,
+    )
+    queryset = Material.objects.filter(user=user)
+    if len(ids) < len(index):
+        queryset = queryset.filter(pk__in=ids.tolist())
+    by_id = queryset.in_bulk()
+
+    anomalies = recent_anomalies({'material__user': user}, today)
+
+    materials = []
+    for material_id, stock_code, expiry_code in zip(ids.tolist(), stock, expiry_status):
+        material = by_id.get(material_id)
+        if material is None:
+            continue
+        material.recent_anomalies = anomalies.get(material.pk, [])
+        material.row_class = status_row_class(STOCK_NAMES[stock_code], EXPIRY_NAMES[expiry_code])
+        if EXPIRY_NAMES[expiry_code]:
+            material.expiry_status = EXPIRY_NAMES[expiry_code]
+        materials.append(material)
+
+    total_count = counts['total']
+    critical_count = counts['critical']
+    below_threshold_count = counts['below_threshold']
+    soon_expiry_count = counts['soon_expiry']
 
     context = {
         'materials': materials,
@@ -175,11 +216,13 @@ def material_list(request):
         'critical_count': critical_count,
         'below_threshold_count': below_threshold_count,
         'soon_expiry_count': soon_expiry_count,
+        'live_updates': live_updates_available(request),
     }
     return render(request, 'materials/material_list.html', context)
 
 
 @login_required
+@read_replica()
 def analytics_report(request):
     """Отчет по оборачиваемости"""
     user = request.user
@@ -192,8 +235,11 @@ def analytics_report(request):
         operation_date__range=[start_date, end_date],
     ).values('material__name', 'material', 'operation_type').annotate(total_quantity=Sum('quantity'))
 
+    # Операции, перенесенные в архив, учитываются по дневным итогам
+    archived_data = rollup_totals({'material__user': user}, start_date, end_date)
+
     material_stats = {}
-    for item in history_data:
+    for item in list(history_data) + list(archived_data):
         material_id = item['material']
         if material_id not in material_stats:
             material_stats[material_id] = {'usage': 0, 'income': 0}
@@ -228,16 +274,109 @@ def analytics_report(request):
     })
 
 
+def _int_param(raw, default, low, high):
+    """Целое из параметра запроса в пределах [low, high]; некорректное значение — default"""
+    try:
+        value = int(raw)
+    except (TypeError, ValueError):
+        value = default
+    return min(max(value, low), high)
+
+
+def _date_param(raw):
+    """Дата ГГГГ-ММ-ДД из параметра запроса или None"""
+    try:
+        return date.fromisoformat(raw)
+    except (TypeError, ValueError):
+        return None
+
+
+@login_required
+@read_replica()
+def category_report(request):
+    """
+    Приход, расход и списание по категориям и периодам (неделя/месяц) из куба аналитики.
+    Детализация: все категории → одна категория → материалы категории за один период.
+    """
+    user = request.user
+    period = request.GET.get('period', AnalyticsCube.Period.MONTH)
+    if period not in AnalyticsCube.Period.values:
+        period = AnalyticsCube.Period.MONTH
+    periods = _int_param(request.GET.get('periods'), default=12, low=1, high=104)
+
+    end_date = date.today()
+    start_date = period_start(end_date, period)
+    for _ in range(periods - 1):
+        start_date = period_start(start_date - timedelta(days=1), period)
+
+    category_param = request.GET.get('category', '')
+    uncategorized = category_param == 'none'
+    category = None
+    if category_param.isdigit():
+        category = get_object_or_404(Category, pk=category_param, user=user)
+
+    series, categories = cube_report(user, period, start_date, end_date,
+                                     category=category, uncategorized=uncategorized)
+
+    # Нижний уровень детализации — материалы в одном периоде (читаются только строки этого периода)
+    material_rows = None
+    selected_start = _date_param(request.GET.get('period_start'))
+    if selected_start and (category is not None or uncategorized):
+        selected_start = period_start(selected_start, period)
+        selected_end = period_end(selected_start, period)
+        material_filter = {'material__user': user, 'material__category': category}
+        history = UsageHistory.objects.filter(
+            operation_date__range=[selected_start, selected_end], **material_filter,
+        ).values('material', 'operation_type').annotate(total_quantity=Sum('quantity')).order_by()
+        archived = rollup_totals(material_filter, selected_start, selected_end)
+
+        totals = {}
+        key_by_type = {'IN': 'income', 'OUT': 'usage', 'DISP': 'writeoff'}
+        for item in list(history) + list(archived):
+            row = totals.setdefault(item['material'], {'income': 0, 'usage': 0, 'writeoff': 0})
+            row[key_by_type[item['operation_type']]] += item['total_quantity']
+        names = dict(Material.objects.filter(pk__in=totals).values_list('pk', 'name'))
+        material_rows = sorted(
+            ({'material_id': pk, 'name': names.get(pk, '—'), **values} for pk, values in totals.items()),
+            key=lambda item: item['usage'] + item['writeoff'], reverse=True,
+        )
+    else:
+        selected_start = None
+
+    return render(request, 'materials/category_report.html', {
+        'series': series,
+        'categories': categories,
+        'material_rows': material_rows,
+        'selected_start': selected_start,
+        'period': period,
+        'periods': periods,
+        'category': category,
+        'uncategorized': uncategorized,
+        'category_param': category_param,
+        'start_date': start_date,
+        'end_date': end_date,
+        'chart': {
+            'labels': [point['period_start'].strftime('%d.%m.%Y' if period == 'W' else '%m.%Y')
+                       for point in series],
+            'income': [point['income'] for point in series],
+            'usage': [point['usage'] for point in series],
+            'writeoff': [point['writeoff'] for point in series],
+        },
+    })
+
+
 # --- ИНТЕГРИРОВАННАЯ ФУНКЦИЯ ПРОГНОЗА ---
 
 @login_required
+@forecast_admission
+@read_replica()
 def material_forecast(request, pk):
     """
     Представление для отображения прогноза спроса с использованием ИИ GigaChat.
     """
     material = get_object_or_404(Material, pk=pk, user=request.user)
 
-    forecast_days = int(request.GET.get('days', 30))
+    forecast_days = forecast_horizon(request.GET.get('days'))
 
     recommendation_data = get_recommendation(
         material_id=pk,
@@ -262,4 +401,93 @@ def material_forecast(request, pk):
 
     recommendation_data['material'] = material
 
-    return render(request, 'materials/material_forecast.html', recommendation_data)
\ No newline at end of file
+    return render(request, 'materials/material_forecast.html', recommendation_data)
+
+
+@login_required
+@forecast_admission
+@read_replica()
+def purchase_plan(request):
+    """План закупок по всем материалам склада (без запросов к ИИ), также выгружается в CSV"""
+    forecast_days = forecast_horizon(request.GET.get('days'))
+    show_all = request.GET.get('all') == '1'
+    plan = get_purchase_plan(request.user, days_to_forecast=forecast_days, only_purchase=not show_all)
+
+    if request.GET.get('format') == 'csv':
+        response = HttpResponse(content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="purchase_plan_{date.today():%Y%m%d}.csv"'
+        response.write('\ufeff')  # BOM, чтобы Excel корректно открыл кириллицу
+        writer = csv.writer(response, delimiter=';')
+        writer.writerow(['Категория', 'Артикул', 'Материал', 'Ед.', 'Остаток', 'Прогноз расхода',
+                         'Рекомендуемый запас', 'Закупить'])
+        for group in plan:
+            for item in group['items']:
+                material = item['material']
+                writer.writerow([group['category'], material.article_number or '', material.name, material.unit,
+                                 item['current_stock'], item['predicted_usage'], item['recommended_stock'],
+                                 item['display_delta']])
+        return response
+
+    return render(request, 'materials/purchase_plan.html', {
+        'plan': plan,
+        'days': forecast_days,
+        'show_all': show_all,
+        'items_count': sum(len(group['items']) for group in plan),
+    })
+
+
+@staff_member_required
+def forecast_metrics(request):
+    """Состояние ограничителя прогнозов в текущем процессе: очередь, выполняемые и отклоненные запросы"""
+    return JsonResponse(get_forecast_limiter().metrics())
+
+
+@staff_member_required
+def staff_dashboard(request):
+    """Сводка по складам всех пользователей для сотрудников: берется из кэша, обновляется командой или кнопкой"""
+    if request.method == 'POST':
+        refresh_dashboard()
+        return redirect('staff_dashboard')
+
+    dashboard = get_dashboard()
+    rows = dashboard['rows']
+    search = request.GET.get('q', '').strip()
+    if search:
+        rows = [row for row in rows if search.lower() in row['username'].lower()]
+
+    sort = request.GET.get('sort', '-critical')
+    field = sort.lstrip('-')
+    if field not in SORT_FIELDS:
+        sort, field = '-critical', 'critical'
+    if field != 'username':
+        rows = sorted(rows, key=lambda row: row[field], reverse=sort.startswith('-'))
+    elif sort.startswith('-'):
+        rows = rows[::-1]
+
+    page = Paginator(rows, 50).get_page(request.GET.get('page'))
+    return render(request, 'materials/staff_dashboard.html', {
+        'page': page,
+        'summary': dashboard['summary'],
+        'first_week': dashboard['first_week'],
+        'weeks': dashboard['weeks'],
+        'generated_at': dashboard['generated_at'],
+        'search': search,
+        'sort': sort,
+    })
+
+
+@login_required
+def safety_stock(request):
+    """
+    Пересчет минимальных порогов как страхового запаса: GET показывает изменения,
+    POST сохраняет их для всего склада.
+    """
+    params = safety_stock_settings()
+    applied = request.method == 'POST'
+    changes = recalculate_thresholds({'user': request.user}, dry_run=not applied, **params)
+    return render(request, 'materials/safety_stock.html', {
+        'changes': changes,
+        'applied': applied,
+        'lead_time_days': params['lead_time_days'],
+        'service_level_percent': round(params['service_level'] * 100, 1),
+    })